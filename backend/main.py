@@ -1,7 +1,9 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Request
+from fastapi import FastAPI, HTTPException, Depends, status, Request, Response, Query, BackgroundTasks
 from fastapi import File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy import (
     create_engine,
@@ -13,11 +15,23 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
     Boolean,
+    inspect,
+    insert,
+    update,
+    Index,
     text,
+    and_,
+    or_,
+    bindparam,
+    exists,
+    func,
+    case,
+    select,
 )
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-from pydantic import BaseModel, Field
+from sqlalchemy.orm import sessionmaker, Session, aliased, load_only
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional
 from datetime import datetime, timedelta
 import smtplib
@@ -33,8 +47,14 @@ import hashlib
 import logging
 import urllib.parse
 import io
+import csv
 import html
 import random
+import base64
+import threading
+import time
+import calendar
+from collections import OrderedDict
 
 # Cloudinary optional integration
 try:
@@ -43,6 +63,18 @@ try:
 except Exception:
     cloudinary = None
 
+# Optional fast JSON encoder for large list responses (enable with FAST_JSON=1)
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+# Optional brotli compression; gzip from Starlette is used otherwise
+try:
+    from brotli_asgi import BrotliMiddleware
+except Exception:
+    BrotliMiddleware = None
+
 
 # Security setup
 # Read secrets from environment variables for production deployment
@@ -52,6 +84,11 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
 
 
 AUTH_INVALID = "Could not validate credentials"
+PRODUCT_NOT_FOUND = "Product not found"
+
+# Placeholder images used by the dev demo product endpoint
+DEMO_IMG_1 = "https://placehold.co/600x800/e53935/ffffff?text=Red"
+DEMO_IMG_2 = "https://placehold.co/600x800/1e88e5/ffffff?text=Blue"
 
 # Password hashing: use pbkdf2_sha256 to avoid bcrypt C dependency and its limits
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
@@ -90,6 +127,16 @@ class Product(Base):
     # size removed - sizes are tracked on variants
     age_group = Column(String, nullable=True)
     # stock removed - per-variant stock is tracked on VariantSize
+    # review aggregates, maintained by create_review (rating_N = reviews with N stars)
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_sum = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_1 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_2 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_3 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_4 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_5 = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (Index("ix_products_category_subcategory", "category", "subcategory"),)
 
 
 class Service(Base):
@@ -101,6 +148,9 @@ class Service(Base):
     price = Column(Float, nullable=True)
     required_documents = Column(Text, nullable=True)
 
+    # natural key used by the startup seed
+    __table_args__ = (Index("ix_services_name_category", "name", "category"),)
+
 
 class Booking(Base):
     __tablename__ = "bookings"
@@ -136,6 +186,15 @@ class Order(Base):
     total_amount = Column(Float)
     items = Column(Text)  # JSON string of items
     created_at = Column(DateTime, default=datetime.utcnow)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    # "my orders" pages through WHERE user_id = ? ORDER BY created_at DESC, id DESC;
+    # the admin listing pages through (created_at, id) and filters by email
+    __table_args__ = (
+        Index("ix_orders_email_created_at", "email", "created_at"),
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        Index("ix_orders_user_id_created_at", "user_id", "created_at", "id"),
+    )
 
 
 class Shipment(Base):
@@ -146,6 +205,9 @@ class Shipment(Base):
     tracking_number = Column(String, nullable=True)
     shipped_at = Column(DateTime, nullable=True)
 
+    # latest shipment per order
+    __table_args__ = (Index("ix_shipments_order_id_shipped_at", "order_id", "shipped_at"),)
+
 
 class User(Base):
     __tablename__ = "users"
@@ -194,6 +256,10 @@ class PasswordResetOTP(Base):
     used = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_password_reset_otps_lookup", "email", "otp", "used", "expires_at"),
+    )
+
 
 # Payment model (Razorpay QR integration)
 class Payment(Base):
@@ -203,7 +269,7 @@ class Payment(Base):
     amount = Column(Integer)  # stored in paise
     currency = Column(String, default="INR")
     provider = Column(String, default="razorpay")
-    provider_order_id = Column(String, nullable=True)  # qr id
+    provider_order_id = Column(String, nullable=True, index=True)  # qr id
     provider_payment_id = Column(String, nullable=True)  # razorpay payment id when paid
     status = Column(String, default="pending")
     metadata_json = Column(Text, nullable=True)
@@ -216,28 +282,6 @@ class Payment(Base):
     )
 
 
-# Ensure tables exist (call again after adding Payment)
-Base.metadata.create_all(bind=engine)
-# Ensure any newly-added models (like PasswordResetOTP) are created as well
-try:
-    Base.metadata.create_all(bind=engine)
-except Exception:
-    pass
-# Try to add `colors` column if it does not exist; ignore failures
-try:
-    with engine.connect() as conn:
-        conn.execute("ALTER TABLE products ADD COLUMN colors TEXT")
-except Exception:
-    pass
-
-# Try to add `wishlist` column on user_profiles if it does not exist; ignore failures
-try:
-    with engine.connect() as conn:
-        conn.execute("ALTER TABLE user_profiles ADD COLUMN wishlist TEXT")
-except Exception:
-    pass
-
-
 # Reviews model
 class Review(Base):
     __tablename__ = "reviews"
@@ -248,6 +292,12 @@ class Review(Base):
     text = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # keyset pagination of a product's reviews by newest / by rating
+    __table_args__ = (
+        Index("ix_reviews_product_created_at", "product_id", "created_at", "id"),
+        Index("ix_reviews_product_rating", "product_id", "rating", "created_at", "id"),
+    )
+
 
 # Variant models: parent/child product variants (color, images, sizes)
 class Variant(Base):
@@ -259,6 +309,8 @@ class Variant(Base):
     color = Column(String, nullable=False)
     color_code = Column(String, nullable=True)
 
+    __table_args__ = (Index("ix_product_variants_product_id", "product_id", "id"),)
+
 
 class VariantImage(Base):
     __tablename__ = "variant_images"
@@ -268,6 +320,8 @@ class VariantImage(Base):
     )
     image_url = Column(String, nullable=False)
 
+    __table_args__ = (Index("ix_variant_images_variant_id", "variant_id", "id"),)
+
 
 class VariantSize(Base):
     __tablename__ = "variant_sizes"
@@ -278,9 +332,18 @@ class VariantSize(Base):
     size = Column(String, nullable=False)
     stock = Column(Integer, default=0)
 
+    __table_args__ = (Index("ix_variant_sizes_variant_id_size", "variant_id", "size"),)
 
-# create any new tables (safe to run multiple times)
-Base.metadata.create_all(bind=engine)
+
+# Denormalized product read model: the fully serialized product JSON, rebuilt in the
+# same transaction as every product/variant write so reads are a primary-key lookup.
+class ProductDocument(Base):
+    __tablename__ = "product_documents"
+    product_id = Column(
+        Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True
+    )
+    document = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 # Admin notifications model — stores events admins should action/acknowledge
@@ -295,9 +358,90 @@ class AdminNotification(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     acknowledged_at = Column(DateTime, nullable=True)
 
+    __table_args__ = (
+        Index("ix_admin_notifications_ack_created_at", "is_acknowledged", "created_at"),
+    )
+
+
+# Catalog version counters: bumped on every catalog write so that all workers derive
+# the same ETags and agree on when cached responses are stale.
+class CatalogVersion(Base):
+    __tablename__ = "catalog_versions"
+    scope = Column(String, primary_key=True)  # 'products', 'services', 'reviews:<product_id>'
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Long-running maintenance jobs (e.g. the variant backfill). Progress is committed
+# with each chunk so an interrupted job resumes where it stopped.
+class BackfillJob(Base):
+    __tablename__ = "backfill_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False, index=True)  # 'variants'
+    status = Column(String, nullable=False, default="pending")  # pending, running, completed, failed
+    last_product_id = Column(Integer, nullable=False, default=0)  # resume cursor
+    products_done = Column(Integer, nullable=False, default=0)
+    variants_created = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+# Stock held for a checkout. Reserving decrements VariantSize.stock right away, so
+# `stock` is always what is still available; a held reservation is either
+# committed when its payment is captured or released (stock returned) on expiry.
+class StockReservation(Base):
+    __tablename__ = "stock_reservations"
+    id = Column(Integer, primary_key=True, index=True)
+    variant_size_id = Column(
+        Integer, ForeignKey("variant_sizes.id", ondelete="CASCADE"), nullable=False
+    )
+    quantity = Column(Integer, nullable=False)
+    payment_id = Column(Integer, ForeignKey("payments.id"), nullable=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=True)
+    status = Column(String, nullable=False, default="held")  # held, committed, released
+    expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # expiry sweep: WHERE status = 'held' AND expires_at < now
+    __table_args__ = (Index("ix_stock_reservations_status_expires_at", "status", "expires_at"),)
+
 
-# ensure the notifications table exists as well
-Base.metadata.create_all(bind=engine)
+# One row per order line, written together with the order. product_id and
+# variant_id carry no foreign keys so sales history survives catalog deletes.
+class OrderItem(Base):
+    __tablename__ = "order_items"
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, nullable=True)
+    variant_id = Column(Integer, nullable=True)
+    size = Column(String, nullable=True)
+    quantity = Column(Integer, nullable=False, default=1)
+    unit_price = Column(Float, nullable=True)
+
+    # lines of an order; sales per product / per variant size
+    __table_args__ = (
+        Index("ix_order_items_order_id", "order_id"),
+        Index("ix_order_items_product_id", "product_id"),
+        Index("ix_order_items_variant_id_size", "variant_id", "size"),
+    )
+
+
+# Applied schema migrations (see "Schema migrations" below)
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    version = Column(Integer, primary_key=True)
+    description = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Startup seeds already applied, and for which schema version
+class SeedRun(Base):
+    __tablename__ = "seed_runs"
+    name = Column(String, primary_key=True)  # 'services'
+    schema_version = Column(Integer, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
 
 
 # Pydantic models
@@ -363,9 +507,13 @@ class ProductUpdate(BaseModel):
     # stock removed from parent
 
 
+class ProductBatchRequest(BaseModel):
+    ids: List[int]
+
+
 class ReviewCreate(BaseModel):
     user_name: Optional[str] = None
-    rating: Optional[int] = 5
+    rating: Optional[int] = Field(5, ge=1, le=5)
     text: Optional[str] = None
 
 
@@ -409,9 +557,12 @@ class OrderCreate(BaseModel):
     email: str
     phone: str
     address: str
-    total_amount: float
+    # ignored: the total is recomputed from catalog prices
+    total_amount: Optional[float] = None
     items: str
     payment_method: Optional[str] = 'upi'
+    # local payment id of a paid UPI QR; its stock reservation becomes this order's
+    payment_id: Optional[int] = None
 
 
 class ShipmentCreate(BaseModel):
@@ -420,6 +571,20 @@ class ShipmentCreate(BaseModel):
     tracking_number: Optional[str] = None
 
 
+class InventoryAdjustment(BaseModel):
+    """One stock correction: give either `delta` (relative) or `stock` (absolute)."""
+    variant_id: int
+    size: str
+    delta: Optional[int] = None
+    stock: Optional[int] = None
+
+
+class InventoryBulkRequest(BaseModel):
+    rows: List[InventoryAdjustment]
+    # reject the whole batch when any row fails instead of applying the valid rows
+    all_or_nothing: bool = False
+
+
 # FastAPI app
 app = FastAPI(title="Vruksha Services API")
 
@@ -433,8 +598,41 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # pagination cursors and ETags are returned in response headers
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Response compression for large JSON/CSV payloads. Responses smaller than
+# COMPRESSION_MIN_SIZE bytes are sent as-is; COMPRESSION=off disables it.
+COMPRESSION = os.getenv("COMPRESSION", "auto").lower()
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+if COMPRESSION not in ("0", "off", "false", "no"):
+    if BrotliMiddleware is not None and COMPRESSION in ("auto", "br", "brotli"):
+        # falls back to gzip for clients that don't accept br
+        app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+    else:
+        app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE, compresslevel=6)
+
+# Fast serialization path: list endpoints return JSON-native dicts and encode them
+# directly (with orjson when enabled) instead of going through jsonable_encoder.
+FAST_JSON = orjson is not None and os.getenv("FAST_JSON", "0").lower() in ("1", "true", "yes")
+
+
+def json_response(content, response: Optional[Response] = None, status_code: int = 200) -> Response:
+    """Encode JSON-native `content` straight into a response, carrying over any
+    headers (ETag, cursors) already set on the injected `response`.
+    """
+    headers = dict(response.headers) if response is not None else None
+    if FAST_JSON:
+        return Response(
+            content=orjson.dumps(content),
+            status_code=status_code,
+            media_type="application/json",
+            headers=headers,
+        )
+    return JSONResponse(content=content, status_code=status_code, headers=headers)
+
+
 # Serve local static files (uploads fallback)
 static_dir = os.path.join(os.path.dirname(__file__), 'static')
 os.makedirs(static_dir, exist_ok=True)
@@ -748,7 +946,7 @@ def admin_list_users(
 ):
     """List all users (admin only)."""
     users = db.query(User).order_by(User.created_at.desc()).all()
-    return [
+    return json_response([
         {
             "id": u.id,
             "name": u.name,
@@ -759,7 +957,7 @@ def admin_list_users(
             "created_at": u.created_at.isoformat() if u.created_at else None,
         }
         for u in users
-    ]
+    ])
 
 
 @app.post("/api/admin/users/{user_id}/promote")
@@ -794,6 +992,12 @@ def admin_demote_user(
     return {"id": user.id, "is_admin": False}
 
 
+@app.get("/api/admin/cache/stats")
+def admin_cache_stats(admin_user: User = Depends(get_current_admin)):
+    """Hit/miss/eviction counters of this worker's catalog cache (admin only)."""
+    return catalog_cache.stats()
+
+
 # API Routes
 @app.get("/")
 def read_root():
@@ -821,6 +1025,11 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
         hashed_password=hashed_password,
     )
     db.add(db_user)
+    db.flush()
+    # order history filters on user_id: claim orders placed under this email before signing up
+    db.query(Order).filter(Order.user_id.is_(None), Order.email == db_user.email).update(
+        {Order.user_id: db_user.id}, synchronize_session=False
+    )
     db.commit()
     db.refresh(db_user)
 
@@ -1084,330 +1293,2130 @@ def update_my_profile(
     return {"user": user_data}
 
 
-# Products
-@app.post("/api/products")
-def create_product(product: ProductCreate):
-    db = SessionLocal()
-    try:
-        product_dict = product.dict()
-        # Handle optional fields properly
-        db_product = Product(
-            name=product_dict.get("name"),
-            category=product_dict.get("category"),
-            subcategory=product_dict.get("subcategory"),
-            description=product_dict.get("description"),
-            price=product_dict.get("price"),
-            colors=(
-                json.dumps(product_dict.get("colors"))
-                if product_dict.get("colors")
-                else None
-            ),
-            age_group=product_dict.get("age_group"),
-            # parent-level stock removed
-        )
-        db.add(db_product)
-        db.commit()
-        db.refresh(db_product)
-        return {"id": db_product.id, "message": "Product created successfully"}
-    except Exception:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Failed to create product")
-    finally:
-        db.close()
+# Catalog read cache
+# Serialized catalog responses are kept in a bounded, per-process LRU cache with a
+# TTL. Entries are tagged ("products", "product:<id>", "services") so the write
+# endpoints can drop exactly the responses they affect. The TTL bounds staleness
+# across worker processes, which do not see each other's invalidations.
+class CatalogCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, tags, value)
+        self._tags = {}  # tag -> set of keys
+        self._lock = threading.Lock()
+        # bumped on every invalidation; a read that started before a write must
+        # not store the (possibly stale) result it computed
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _drop(self, key):
+        _, tags, _ = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        """Return the cached value for `key`, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, tags, generation: int):
+        """Store `value` unless the cache was invalidated since `generation` was read."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, tuple(tags), value)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
 
 
-@app.get("/api/products", response_model=List[dict])
-def get_products(category: Optional[str] = None):
+catalog_cache = CatalogCache(
+    maxsize=int(os.getenv("CATALOG_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("CATALOG_CACHE_TTL", "60")),
+)
+
+
+def catalog_version(db: Session, scope: str) -> str:
+    """Return an opaque version token for a catalog scope ('0' when never written)."""
+    row = (
+        db.query(CatalogVersion.version, CatalogVersion.updated_at)
+        .filter(CatalogVersion.scope == scope)
+        .first()
+    )
+    if not row:
+        return "0"
+    # the timestamp keeps tokens unique if the counter restarts on a fresh database
+    return f"{row.version}.{row.updated_at.timestamp() if row.updated_at else 0}"
+
+
+def bump_catalog_version(*scopes: str):
+    """Increment the persisted version of each scope in its own short transaction.
+    Called after the data commit so a client never sees a new version with old data.
+    """
     db = SessionLocal()
     try:
-        query = db.query(Product)
-        if category:
-            query = query.filter(Product.category == category)
-        products = query.all()
-        result = []
-        for p in products:
-            try:
-                colors = json.loads(p.colors) if p.colors else None
-            except Exception:
-                colors = None
-            # load variants if present
-            variants = []
+        # a second attempt covers two writers racing to insert a scope's first row
+        for _ in range(2):
             try:
-                v_rows = db.query(Variant).filter(Variant.product_id == p.id).all()
-                for v in v_rows:
-                    imgs = [
-                        vi.image_url
-                        for vi in db.query(VariantImage)
-                        .filter(VariantImage.variant_id == v.id)
-                        .all()
-                    ]
-                    sizes = [
-                        {"size": vs.size, "stock": vs.stock}
-                        for vs in db.query(VariantSize)
-                        .filter(VariantSize.variant_id == v.id)
-                        .all()
-                    ]
-                    variants.append(
-                        {
-                            "id": v.id,
-                            "color": v.color,
-                            "color_code": v.color_code,
-                            "images": imgs,
-                            "sizes": sizes,
-                        }
+                now = datetime.utcnow()
+                for scope in scopes:
+                    updated = (
+                        db.query(CatalogVersion)
+                        .filter(CatalogVersion.scope == scope)
+                        .update(
+                            {CatalogVersion.version: CatalogVersion.version + 1, CatalogVersion.updated_at: now},
+                            synchronize_session=False,
+                        )
                     )
+                    if not updated:
+                        db.add(CatalogVersion(scope=scope, version=1, updated_at=now))
+                db.commit()
+                return
             except Exception:
-                variants = []
-            # prefer images from first variant when available
-            images = []
-            if variants and variants[0].get("images"):
-                images = variants[0].get("images")
-            result.append(
-                {
-                    "id": p.id,
-                    "name": p.name,
-                    "category": p.category,
-                    "subcategory": p.subcategory,
-                    "description": p.description,
-                    "price": p.price,
-                    "images": images,
-                    "colors": colors,
-                    "variants": variants,
-                    "age_group": p.age_group,
-                }
-            )
-        return result
+                db.rollback()
+        logger.warning(f"Failed to bump catalog version for {scopes}")
     finally:
         db.close()
 
 
-# Image upload endpoint: uploads to Cloudinary if configured, otherwise saves locally to backend/static/uploads
-@app.post("/api/upload")
-def upload_image(file: UploadFile = File(...)):
-    """Accepts a multipart file and returns JSON { image_url: ... }.
-    Requires CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, CLOUDINARY_API_SECRET env vars to upload to Cloudinary.
-    Falls back to saving the file under backend/static/uploads and returning a local path URL.
+def invalidate_products(*product_ids: int):
+    """Record a product write: bump the catalog version and drop cached listings
+    and the detail entries of the given products.
     """
-    # Prefer Cloudinary when available and configured
-    cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME")
-    cloud_key = os.getenv("CLOUDINARY_API_KEY")
-    cloud_secret = os.getenv("CLOUDINARY_API_SECRET")
-    try:
-        contents = file.file.read()
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to read uploaded file: {e}")
+    bump_catalog_version("products")
+    catalog_cache.invalidate("products", *[f"product:{pid}" for pid in product_ids])
 
-    if cloudinary and cloud_name and cloud_key and cloud_secret:
-        try:
-            cloudinary.config(
-                cloud_name=cloud_name,
-                api_key=cloud_key,
-                api_secret=cloud_secret,
-                secure=True,
-            )
-            # upload accepts a file-like object; wrap bytes in BytesIO
-            res = cloudinary.uploader.upload(io.BytesIO(contents), resource_type="image")
-            image_url = res.get("secure_url") or res.get("url")
-            return {"image_url": image_url}
-        except Exception as e:
-            # fallback to local storage if Cloudinary fails
-            logging.exception("Cloudinary upload failed")
 
-    # Local fallback: save under backend/static/uploads
-    uploads_dir = os.path.join(os.path.dirname(__file__), "static", "uploads")
-    os.makedirs(uploads_dir, exist_ok=True)
-    filename = f"{int(datetime.utcnow().timestamp())}_{os.path.basename(file.filename)}"
-    dest_path = os.path.join(uploads_dir, filename)
-    try:
-        with open(dest_path, "wb") as f:
-            f.write(contents)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save file locally: {e}")
+# Stock changes (checkouts, QR reservations) do not bump the catalog version, which
+# would drop every cached listing and ETag on each order. Product details follow
+# their own document timestamp; listings, facets, search and batch responses are
+# versioned per CATALOG_STOCK_LAG-second window, so they show new stock within it.
+CATALOG_STOCK_LAG = max(int(os.getenv("CATALOG_STOCK_LAG", "60")), 1)
 
-    # Return relative path the frontend can use (assumes static files served from /static)
-    image_url = f"/static/uploads/{filename}"
-    return {"image_url": image_url}
 
+def listing_version(db: Session) -> str:
+    """Version token of multi-product responses: catalog version plus stock window."""
+    return f"{catalog_version(db, 'products')}.{int(time.time()) // CATALOG_STOCK_LAG}"
 
-@app.get("/api/products/{product_id}")
-def get_product(product_id: int):
-    db = SessionLocal()
-    try:
-        product = db.query(Product).filter(Product.id == product_id).first()
-        if not product:
-            raise HTTPException(status_code=404, detail=PRODUCT_NOT_FOUND)
-        # include images as an array: prefer first variant's images
-        images = []
-        try:
-            colors = json.loads(product.colors) if product.colors else None
-        except Exception:
-            colors = None
-        # load variants if any
-        variants = []
-        try:
-            v_rows = db.query(Variant).filter(Variant.product_id == product.id).all()
-            for v in v_rows:
-                imgs = [
-                    vi.image_url
-                    for vi in db.query(VariantImage)
-                    .filter(VariantImage.variant_id == v.id)
-                    .all()
-                ]
-                sizes = [
-                    {"size": vs.size, "stock": vs.stock}
-                    for vs in db.query(VariantSize)
-                    .filter(VariantSize.variant_id == v.id)
-                    .all()
-                ]
-                variants.append(
-                    {
-                        "id": v.id,
-                        "color": v.color,
-                        "color_code": v.color_code,
-                        "images": imgs,
-                        "sizes": sizes,
-                    }
-                )
-        except Exception:
-            variants = []
-        # prefer images from first variant
-        if variants and variants[0].get("images"):
-            images = variants[0].get("images")
-        return {
-            "id": product.id,
-            "name": product.name,
-            "category": product.category,
-            "subcategory": product.subcategory,
-            "description": product.description,
-            "price": product.price,
-            "images": images,
-            "colors": colors,
-            "variants": variants,
-            "age_group": product.age_group,
-        }
-    finally:
-        db.close()
 
+def invalidate_stock(*product_ids: int):
+    """Record a stock change of the given products: drop their cached details only."""
+    catalog_cache.invalidate(*[f"product:{pid}" for pid in product_ids])
 
-@app.post("/api/admin/variants/backfill")
-def admin_backfill_variants(
-    admin_user: User = Depends(get_current_admin), db: Session = Depends(get_db)
-):
-    """Backfill variants from legacy `colors` column for products that don't have variants yet.
-    Idempotent: will skip products that already have variants.
-    """
-    count = 0
-    products = db.query(Product).all()
-    for p in products:
-        existing = db.query(Variant).filter(Variant.product_id == p.id).first()
-        if existing:
+
+def invalidate_services():
+    bump_catalog_version("services")
+    catalog_cache.invalidate("services")
+
+
+# Conditional GET support
+# Catalog responses carry a strong ETag derived from the scope's version and the
+# request URL; a matching If-None-Match short-circuits to 304 before any loading.
+CATALOG_CACHE_CONTROL = f"public, max-age={int(os.getenv('CATALOG_MAX_AGE', '0'))}, must-revalidate"
+
+
+def conditional_get(request: Request, response: Response, version: str) -> Optional[Response]:
+    """Set ETag/Cache-Control on `response`; return a 304 response when the client's
+    If-None-Match already matches, otherwise None.
+    """
+    query = urllib.parse.urlencode(sorted(request.query_params.multi_items()))
+    digest = hashlib.sha1(f"{version}|{request.url.path}?{query}".encode()).hexdigest()
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    response.headers.update(headers)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        # If-None-Match uses weak comparison, so W/ prefixes are ignored
+        if "*" in tags or etag in [t[2:] if t.startswith("W/") else t for t in tags]:
+            return Response(status_code=304, headers=headers)
+    return None
+
+
+# Catalog loading
+# Products are serialized together with their variants, images and sizes using a
+# fixed number of set-based queries (variants, images, sizes) per chunk of product
+# ids instead of one query per product/variant. Chunking keeps IN-lists below the
+# bound-parameter limits of SQLite and Postgres.
+CATALOG_CHUNK_SIZE = 500
+
+
+def _chunks(seq: list, size: int):
+    for i in range(0, len(seq), size):
+        yield seq[i : i + size]
+
+
+def load_variants(db: Session, product_ids: List[int], sizes: bool = True) -> dict:
+    """Return {product_id: [variant dict, ...]} for the given product ids.
+    Variants, images and sizes keep their insertion (id) order; pass sizes=False
+    to skip the size query (variants are then returned without a "sizes" key).
+    """
+    by_product = {pid: [] for pid in product_ids}
+    for chunk in _chunks(list(by_product.keys()), CATALOG_CHUNK_SIZE):
+        v_rows = (
+            db.query(Variant.id, Variant.product_id, Variant.color, Variant.color_code)
+            .filter(Variant.product_id.in_(chunk))
+            .order_by(Variant.id)
+            .all()
+        )
+        if not v_rows:
             continue
-        try:
-            colors = json.loads(p.colors) if p.colors else None
-        except Exception:
-            colors = None
-        if not colors:
-            # create single default variant (no images) when legacy colors absent
-            v = Variant(product_id=p.id, color="Default", color_code=None)
-            db.add(v)
-            db.commit()
-            db.refresh(v)
-            # no parent image available; variant will start without images
-            db.commit()
-            count += 1
+        variants = {}
+        for vid, pid, color, color_code in v_rows:
+            variants[vid] = {
+                "id": vid,
+                "color": color,
+                "color_code": color_code,
+                "images": [],
+            }
+            if sizes:
+                variants[vid]["sizes"] = []
+            by_product[pid].append(variants[vid])
+        # images and sizes are fetched through a join on the product ids so the
+        # bound parameters stay proportional to the product chunk, not the variants
+        img_rows = (
+            db.query(VariantImage.variant_id, VariantImage.image_url)
+            .join(Variant, Variant.id == VariantImage.variant_id)
+            .filter(Variant.product_id.in_(chunk))
+            .order_by(VariantImage.id)
+            .all()
+        )
+        for vid, url in img_rows:
+            variants[vid]["images"].append(url)
+        if not sizes:
             continue
-        for c in colors:
-            name = c.get("name") or "Variant"
-            hexc = c.get("hex")
-            v = Variant(product_id=p.id, color=name, color_code=hexc)
-            db.add(v)
-            db.commit()
-            db.refresh(v)
-            imgs = c.get("images") or []
-            for url in imgs:
-                vi = VariantImage(variant_id=v.id, image_url=url)
-                db.add(vi)
-            db.commit()
-            count += 1
-    return {"backfilled_variants": count}
+        size_rows = (
+            db.query(VariantSize.variant_id, VariantSize.size, VariantSize.stock)
+            .join(Variant, Variant.id == VariantSize.variant_id)
+            .filter(Variant.product_id.in_(chunk))
+            .order_by(VariantSize.id)
+            .all()
+        )
+        for vid, size, stock in size_rows:
+            variants[vid]["sizes"].append({"size": size, "stock": stock})
+    return by_product
 
 
-@app.post("/api/dev/variants/backfill")
-def dev_backfill_variants(db: Session = Depends(get_db)):
-    """Development backfill endpoint. Runs the same backfill logic but without admin auth.
-    This endpoint is gated by an environment variable for safety. Set DEV=1 or ALLOW_DEV_BACKFILL=1 to enable.
+def load_first_images(db: Session, product_ids: List[int]) -> dict:
+    """Return {product_id: [image url, ...]} holding only the first variant's images,
+    for listings that show a thumbnail without loading every variant.
     """
-    if os.getenv("DEV", "0") not in ("1", "true", "yes") and os.getenv(
-        "ALLOW_DEV_BACKFILL", "0"
-    ) not in (
-        "1",
-        "true",
-        "yes",
-    ):
+    images = {pid: [] for pid in product_ids}
+    for chunk in _chunks(list(images.keys()), CATALOG_CHUNK_SIZE):
+        first_variant = (
+            select(Variant.product_id, func.min(Variant.id).label("variant_id"))
+            .where(Variant.product_id.in_(chunk))
+            .group_by(Variant.product_id)
+            .subquery()
+        )
+        rows = (
+            db.query(first_variant.c.product_id, VariantImage.image_url)
+            .join(VariantImage, VariantImage.variant_id == first_variant.c.variant_id)
+            .order_by(VariantImage.id)
+            .all()
+        )
+        for pid, url in rows:
+            images[pid].append(url)
+    return images
+
+
+# Sparse fieldsets
+# `?fields=` limits the top-level product keys and `?include=` selects the nested
+# relations (variants, sizes) to load. Without either parameter the full product
+# representation is returned.
+PRODUCT_FIELDS = (
+    "id",
+    "name",
+    "category",
+    "subcategory",
+    "description",
+    "price",
+    "images",
+    "colors",
+    "variants",
+    "age_group",
+    "rating",
+    "rating_count",
+    "rating_histogram",
+)
+PRODUCT_INCLUDES = ("variants", "sizes")
+RATING_STAR_COLUMNS = tuple(getattr(Product, f"rating_{star}") for star in range(1, 6))
+_PRODUCT_COLUMNS = {
+    "name": Product.name,
+    "category": Product.category,
+    "subcategory": Product.subcategory,
+    "description": Product.description,
+    "price": Product.price,
+    "colors": Product.colors,
+    "age_group": Product.age_group,
+    "rating": (Product.rating_count, Product.rating_sum),
+    "rating_count": Product.rating_count,
+    "rating_histogram": RATING_STAR_COLUMNS,
+}
+FULL_PRODUCT_VIEW = {"fields": None, "variants": True, "sizes": True}
+
+
+def _parse_fieldset(value: Optional[str], allowed: tuple, param: str) -> Optional[set]:
+    if value is None:
+        return None
+    names = set(_split_csv(value))
+    unknown = names - set(allowed)
+    if unknown:
         raise HTTPException(
-            status_code=403, detail="Dev backfill disabled. Set DEV=1 to enable."
+            status_code=400,
+            detail=f"Unknown {param}: {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}",
         )
+    return names
 
-    count = 0
-    created = []
-    products = db.query(Product).all()
-    for p in products:
-        existing = db.query(Variant).filter(Variant.product_id == p.id).first()
-        if existing:
-            continue
-        try:
-            colors = json.loads(p.colors) if p.colors else None
-        except Exception:
-            colors = None
-        if not colors:
-            # Create a single default variant without parent image/size/stock
-            v = Variant(product_id=p.id, color="Default", color_code=None)
-            db.add(v)
-            db.commit()
-            db.refresh(v)
-            # No images available from parent; variant will start without images
-            db.commit()
-            count += 1
-            created.append({"product_id": p.id, "variant_id": v.id, "color": "Default"})
+
+def product_view(
+    fields: Optional[str] = Query(None, description="Comma-separated product fields to return"),
+    include: Optional[str] = Query(None, description="Relations to load: variants, sizes"),
+) -> dict:
+    """Dependency resolving ?fields= / ?include= into a product view:
+    {"fields": set of keys or None for all, "variants": bool, "sizes": bool}.
+    """
+    selected = _parse_fieldset(fields, PRODUCT_FIELDS, "fields")
+    included = _parse_fieldset(include, PRODUCT_INCLUDES, "include")
+    if selected is not None:
+        selected.add("id")
+    if included is None:
+        # full variants unless the caller narrowed the fields without asking for them
+        included = set(PRODUCT_INCLUDES) if selected is None or "variants" in selected else set()
+    if selected is not None and "variants" in selected:
+        included.add("variants")
+    if "sizes" in included:
+        included.add("variants")
+    return {"fields": selected, "variants": "variants" in included, "sizes": "sizes" in included}
+
+
+def view_key(view: dict) -> tuple:
+    """Hashable form of a product view for cache keys."""
+    fields = tuple(sorted(view["fields"])) if view["fields"] is not None else None
+    return (fields, view["variants"], view["sizes"])
+
+
+def _wants(view: dict, key: str) -> bool:
+    return view["fields"] is None or key in view["fields"]
+
+
+def product_columns(view: dict) -> list:
+    """Product columns needed to serialize `view`, for use with load_only()."""
+    columns = [Product.id]
+    for key, cols in _PRODUCT_COLUMNS.items():
+        if _wants(view, key):
+            columns.extend(cols if isinstance(cols, tuple) else (cols,))
+    return columns
+
+
+def serialize_product(p: Product, variants: list, view: dict = FULL_PRODUCT_VIEW, images: Optional[list] = None) -> dict:
+    """Build the public product representation from a Product row and its variants.
+    Only attributes in `view` are touched, so deferred columns are never loaded.
+    """
+    out = {}
+    for key in PRODUCT_FIELDS:
+        if key == "variants":
+            if view["variants"]:
+                out["variants"] = variants
+        elif not _wants(view, key):
             continue
-        for c in colors:
-            name = c.get("name") or "Variant"
-            hexc = c.get("hex")
-            v = Variant(product_id=p.id, color=name, color_code=hexc)
-            db.add(v)
-            db.commit()
-            db.refresh(v)
-            imgs = c.get("images") or []
-            for url in imgs:
-                vi = VariantImage(variant_id=v.id, image_url=url)
-                db.add(vi)
-            db.commit()
-            count += 1
-            created.append({"product_id": p.id, "variant_id": v.id, "color": name})
+        elif key == "images":
+            # prefer images from first variant when available
+            if images is None:
+                images = variants[0].get("images") if variants and variants[0].get("images") else []
+            out["images"] = images
+        elif key == "colors":
+            try:
+                out["colors"] = json.loads(p.colors) if p.colors else None
+            except Exception:
+                out["colors"] = None
+        elif key == "rating":
+            out["rating"] = round(p.rating_sum / p.rating_count, 2) if p.rating_count else None
+        elif key == "rating_histogram":
+            out["rating_histogram"] = {str(star): getattr(p, f"rating_{star}") or 0 for star in range(1, 6)}
+        else:
+            out[key] = getattr(p, key)
+    return out
+
 
-    return {"backfilled_variants": count, "created": created[:50]}
+def project_product(doc: dict, view: dict) -> dict:
+    """Apply a product view to an already-serialized (full) product document."""
+    if view is FULL_PRODUCT_VIEW or view == FULL_PRODUCT_VIEW:
+        return doc
+    out = {
+        k: v
+        for k, v in doc.items()
+        if (k == "variants" and view["variants"]) or (k != "variants" and _wants(view, k))
+    }
+    if view["variants"] and not view["sizes"]:
+        out["variants"] = [
+            {k: v for k, v in variant.items() if k != "sizes"} for variant in doc.get("variants", [])
+        ]
+    return out
 
 
-@app.post("/api/dev/create_demo_product")
-def dev_create_demo_product(db: Session = Depends(get_db)):
-    """Create a demo product with two variants (Red/Blue) for local testing.
-    Gated by DEV=1 or ALLOW_DEV_BACKFILL=1.
+def load_catalog(db: Session, products: List[Product], view: dict = FULL_PRODUCT_VIEW) -> List[dict]:
+    """Serialize products with their variants in a constant number of queries.
+    The variant tables are skipped entirely when `view` needs neither variants
+    nor images.
     """
-    # if os.getenv("DEV", "0") not in ("1", "true", "yes") and os.getenv("ALLOW_DEV_BACKFILL", "0") not in (
-    #     "1",
-    #     "true",
-    #     "yes",
-    # ):
-    #     raise HTTPException(status_code=403, detail="Dev endpoints disabled. Set DEV=1 to enable.")
+    ids = [p.id for p in products]
+    variants, first_images = {}, None
+    if view["variants"]:
+        variants = load_variants(db, ids, sizes=view["sizes"])
+    elif _wants(view, "images"):
+        first_images = load_first_images(db, ids)
+    return [
+        serialize_product(
+            p,
+            variants.get(p.id, []),
+            view,
+            first_images.get(p.id, []) if first_images is not None else None,
+        )
+        for p in products
+    ]
 
-    demo_name = "Demo Tee - Two Color"
-    demo = db.query(Product).filter(Product.name == demo_name).first()
+
+def serialize_products(db: Session, product_ids: List[int]) -> dict:
+    """{product_id: document JSON text} for existing products, without storing anything."""
+    products = db.query(Product).filter(Product.id.in_(product_ids)).all()
+    return {p["id"]: json.dumps(p, separators=(",", ":")) for p in load_catalog(db, products)}
+
+
+def rebuild_product_documents(db: Session, product_ids: List[int]) -> dict:
+    """Re-serialize the given products into `product_documents` within the caller's
+    transaction (the caller commits). Rows of products that no longer exist are removed.
+    Returns {product_id: document JSON text}.
+    """
+    ids = sorted({int(pid) for pid in product_ids})
+    documents = {}
+    for chunk in _chunks(ids, CATALOG_CHUNK_SIZE):
+        docs = serialize_products(db, chunk)
+        db.query(ProductDocument).filter(ProductDocument.product_id.in_(chunk)).delete(
+            synchronize_session=False
+        )
+        now = datetime.utcnow()
+        db.add_all(
+            [ProductDocument(product_id=pid, document=doc, updated_at=now) for pid, doc in docs.items()]
+        )
+        documents.update(docs)
+    db.flush()
+    return documents
+
+
+def rebuild_all_product_documents(db: Session, batch_size: int = CATALOG_CHUNK_SIZE) -> int:
+    """Rebuild every product document and search entry in id order, committing per batch.
+    Used by scripts/rebuild_product_documents.py after migrations or bulk edits.
+    """
+    total = 0
+    last_id = 0
+    while True:
+        ids = [
+            pid
+            for (pid,) in db.query(Product.id)
+            .filter(Product.id > last_id)
+            .order_by(Product.id)
+            .limit(batch_size)
+            .all()
+        ]
+        if not ids:
+            break
+        reindex_products(db, ids)
+        db.commit()
+        total += len(ids)
+        last_id = ids[-1]
+    # drop documents whose product rows were removed outside the API
+    db.query(ProductDocument).filter(
+        ~exists().where(Product.id == ProductDocument.product_id)
+    ).delete(synchronize_session=False)
+    if SEARCH_BACKEND:
+        db.execute(
+            text(f"DELETE FROM product_search WHERE {SEARCH_KEY} NOT IN (SELECT id FROM products)")
+        )
+    db.commit()
+    return total
+
+
+# Full-text product search
+# SQLite uses an FTS5 virtual table keyed by rowid = product id; Postgres uses a
+# weighted tsvector column behind a GIN index. Both are maintained by the product
+# write endpoints through `reindex_products`. Without either (e.g. SQLite built
+# without FTS5) search falls back to LIKE matching.
+SEARCH_BACKEND = None  # 'fts5', 'postgres' or None
+SEARCH_KEY = "product_id"
+
+
+def create_search_index(conn):
+    if conn.dialect.name == "sqlite":
+        conn.execute(
+            text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+                "name, description, subcategory, colors, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        )
+    elif conn.dialect.name == "postgresql":
+        conn.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS product_search ("
+                "product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE, "
+                "document TSVECTOR NOT NULL)"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_product_search_document "
+                "ON product_search USING GIN (document)"
+            )
+        )
+
+
+def _search_backend(conn) -> tuple:
+    """(backend, key column) of the search index visible on `conn`."""
+    if not inspect(conn).has_table("product_search"):
+        return None, "product_id"
+    if conn.dialect.name == "sqlite":
+        return "fts5", "rowid"
+    if conn.dialect.name == "postgresql":
+        return "postgres", "product_id"
+    return None, "product_id"
+
+
+def detect_search_backend():
+    """Pick the search backend from the schema; the index itself is created by a migration."""
+    global SEARCH_BACKEND, SEARCH_KEY
+    SEARCH_BACKEND = None
+    try:
+        with engine.connect() as conn:
+            SEARCH_BACKEND, SEARCH_KEY = _search_backend(conn)
+    except Exception as exc:
+        SEARCH_BACKEND = None
+        logger.warning(f"Could not inspect the search index, using LIKE fallback: {exc}")
+
+
+# Schema migrations
+# Each migration runs once, in order, in its own transaction and is recorded in
+# `schema_version`. Migration 1 builds a new database straight from the current
+# models, so every later migration must be idempotent (check before ALTER, create
+# indexes with checkfirst). Apply them with `python scripts/create_schema.py`;
+# app startup only verifies the recorded version, unless AUTO_MIGRATE is on
+# (default for local SQLite databases).
+schema_logger = logging.getLogger("vruksha.schema")
+AUTO_MIGRATE = os.getenv(
+    "AUTO_MIGRATE", "1" if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else "0"
+).lower() in ("1", "true", "yes")
+
+
+def _add_column(conn, table: str, column: str, ddl: str):
+    if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _create_indexes(conn, *models):
+    for model in models:
+        # indexes on columns that a later migration adds are created by that migration
+        columns = {c["name"] for c in inspect(conn).get_columns(model.__tablename__)}
+        for index in model.__table__.indexes:
+            if all(column.name in columns for column in index.columns):
+                index.create(bind=conn, checkfirst=True)
+
+
+def _migration_initial(conn):
+    Base.metadata.create_all(bind=conn)
+
+
+def _migration_legacy_columns(conn):
+    # columns added to tables that predate them (previously blind ALTERs at import)
+    _add_column(conn, "products", "colors", "TEXT")
+    _add_column(conn, "user_profiles", "wishlist", "TEXT")
+
+
+def _fill_search_index(conn):
+    """Index every existing product (products written later are indexed by the API)."""
+    global SEARCH_BACKEND, SEARCH_KEY
+    SEARCH_BACKEND, SEARCH_KEY = _search_backend(conn)
+    if not SEARCH_BACKEND:
+        return
+    db = Session(bind=conn)
+    try:
+        sync_product_search(db, list(conn.execute(select(Product.id)).scalars()))
+        db.flush()
+    finally:
+        db.close()
+
+
+def _migration_search_index(conn):
+    try:
+        with conn.begin_nested():
+            create_search_index(conn)
+    except Exception as exc:
+        schema_logger.warning(f"Full-text search index unavailable, using LIKE fallback: {exc}")
+        return
+    _fill_search_index(conn)
+
+
+def _migration_lookup_indexes(conn):
+    _create_indexes(
+        conn,
+        Product,
+        Order,
+        Shipment,
+        PasswordResetOTP,
+        Payment,
+        Variant,
+        VariantImage,
+        VariantSize,
+        AdminNotification,
+    )
+
+
+def _migration_seed_runs(conn):
+    SeedRun.__table__.create(bind=conn, checkfirst=True)
+    _create_indexes(conn, Service)
+
+
+def _migration_rating_aggregates(conn):
+    for column in ("rating_count", "rating_sum", "rating_1", "rating_2", "rating_3", "rating_4", "rating_5"):
+        _add_column(conn, "products", column, "INTEGER NOT NULL DEFAULT 0")
+    backfill_rating_aggregates(conn)
+    # stored documents predate the rating fields; reads do not store documents, so
+    # rebuild them here rather than leave every read serializing from the tables
+    db = Session(bind=conn)
+    try:
+        conn.execute(text("DELETE FROM product_documents"))
+        rebuild_product_documents(db, list(conn.execute(select(Product.id)).scalars()))
+    finally:
+        db.close()
+
+
+def _migration_review_pagination(conn):
+    # unrated legacy reviews have always been shown (and aggregated) as 5 stars
+    conn.execute(text("UPDATE reviews SET rating = 5 WHERE rating IS NULL"))
+    conn.execute(
+        text("UPDATE reviews SET created_at = :epoch WHERE created_at IS NULL"),
+        {"epoch": datetime(1970, 1, 1)},
+    )
+    _create_indexes(conn, Review)
+
+
+def _migration_backfill_jobs(conn):
+    BackfillJob.__table__.create(bind=conn, checkfirst=True)
+
+
+def _migration_stock_reservations(conn):
+    StockReservation.__table__.create(bind=conn, checkfirst=True)
+
+
+def _migration_order_pagination(conn):
+    # keyset cursors need a non-null created_at
+    conn.execute(
+        text("UPDATE orders SET created_at = :epoch WHERE created_at IS NULL"),
+        {"epoch": datetime(1970, 1, 1)},
+    )
+    _create_indexes(conn, Order)
+
+
+def _link_orders_by_email(conn):
+    conn.execute(
+        text(
+            "UPDATE orders SET user_id = (SELECT users.id FROM users WHERE users.email = orders.email) "
+            "WHERE user_id IS NULL"
+        )
+    )
+
+
+def _migration_order_user_id(conn):
+    _add_column(conn, "orders", "user_id", "INTEGER REFERENCES users(id)")
+    _link_orders_by_email(conn)
+    _create_indexes(conn, Order)
+
+
+def _migration_relink_order_users(conn):
+    # webhook orders for payments without a user were stored unlinked until checkout looked the email up
+    _link_orders_by_email(conn)
+
+
+def _migration_order_items(conn):
+    # existing orders are copied over by scripts/backfill_order_items.py
+    OrderItem.__table__.create(bind=conn, checkfirst=True)
+
+
+def _migration_refill_search_index(conn):
+    # databases that went through migration 3 before it indexed existing products
+    _fill_search_index(conn)
+
+
+MIGRATIONS = [
+    (1, "initial schema", _migration_initial),
+    (2, "products.colors and user_profiles.wishlist columns", _migration_legacy_columns),
+    (3, "full-text product search index", _migration_search_index),
+    (4, "composite indexes for hot lookups", _migration_lookup_indexes),
+    (5, "seed_runs table and services natural key index", _migration_seed_runs),
+    (6, "product rating aggregates", _migration_rating_aggregates),
+    (7, "review pagination indexes", _migration_review_pagination),
+    (8, "backfill_jobs table", _migration_backfill_jobs),
+    (9, "stock_reservations table", _migration_stock_reservations),
+    (10, "order listing pagination", _migration_order_pagination),
+    (11, "orders.user_id linked from email", _migration_order_user_id),
+    (12, "order_items table", _migration_order_items),
+    (13, "index existing products for search", _migration_refill_search_index),
+    (14, "orders.user_id relinked from email", _migration_relink_order_users),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_schema_version(conn) -> int:
+    if not inspect(conn).has_table(SchemaVersion.__tablename__):
+        return 0
+    return conn.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+
+
+def migrate(target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations up to `target` (default: latest). Returns the
+    versions applied.
+    """
+    with engine.begin() as conn:
+        SchemaVersion.__table__.create(bind=conn, checkfirst=True)
+        done = set(conn.execute(select(SchemaVersion.version)).scalars())
+    applied = []
+    for version, description, upgrade in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        with engine.begin() as conn:
+            upgrade(conn)
+            conn.execute(
+                insert(SchemaVersion).values(
+                    version=version, description=description, applied_at=datetime.utcnow()
+                )
+            )
+        schema_logger.info(f"Applied schema migration {version}: {description}")
+        applied.append(version)
+    detect_search_backend()
+    return applied
+
+
+def verify_schema():
+    """Startup check: fail fast when the database is behind the code."""
+    with engine.connect() as conn:
+        version = current_schema_version(conn)
+    if version < SCHEMA_VERSION:
+        if not AUTO_MIGRATE:
+            raise RuntimeError(
+                f"Database schema is at version {version}, this build needs {SCHEMA_VERSION}. "
+                "Run `python scripts/create_schema.py` before starting the app."
+            )
+        migrate()
+    elif version > SCHEMA_VERSION:
+        schema_logger.warning(
+            f"Database schema version {version} is newer than this build ({SCHEMA_VERSION})"
+        )
+    detect_search_backend()
+
+
+@app.on_event("startup")
+def check_schema():
+    verify_schema()
+
+
+def sync_product_search(db: Session, product_ids: List[int]):
+    """Replace the search entries of the given products (caller commits)."""
+    if not SEARCH_BACKEND or not product_ids:
+        return
+    ids = sorted({int(pid) for pid in product_ids})
+    delete = text(f"DELETE FROM product_search WHERE {SEARCH_KEY} IN :ids").bindparams(
+        bindparam("ids", expanding=True)
+    )
+    for chunk in _chunks(ids, CATALOG_CHUNK_SIZE):
+        db.execute(delete, {"ids": chunk})
+        products = (
+            db.query(Product)
+            .options(load_only(Product.id, Product.name, Product.description, Product.subcategory))
+            .filter(Product.id.in_(chunk))
+            .all()
+        )
+        if not products:
+            continue
+        colors = {p.id: [] for p in products}
+        for pid, color in (
+            db.query(Variant.product_id, Variant.color)
+            .filter(Variant.product_id.in_(chunk))
+            .order_by(Variant.id)
+        ):
+            colors[pid].append(color or "")
+        rows = [
+            {
+                "id": p.id,
+                "name": p.name or "",
+                "description": p.description or "",
+                "subcategory": p.subcategory or "",
+                "colors": " ".join(colors[p.id]),
+            }
+            for p in products
+        ]
+        if SEARCH_BACKEND == "fts5":
+            stmt = text(
+                "INSERT INTO product_search (rowid, name, description, subcategory, colors) "
+                "VALUES (:id, :name, :description, :subcategory, :colors)"
+            )
+        else:
+            stmt = text(
+                "INSERT INTO product_search (product_id, document) VALUES (:id, "
+                "setweight(to_tsvector('simple', :name), 'A') || "
+                "setweight(to_tsvector('simple', :subcategory), 'B') || "
+                "setweight(to_tsvector('simple', :colors), 'B') || "
+                "setweight(to_tsvector('simple', :description), 'C'))"
+            )
+        db.execute(stmt, rows)
+
+
+def reindex_products(db: Session, product_ids: List[int]) -> dict:
+    """Refresh the read models (documents and search index) of the given products
+    inside the caller's transaction. Returns {product_id: document JSON text}.
+    """
+    documents = rebuild_product_documents(db, product_ids)
+    sync_product_search(db, product_ids)
+    return documents
+
+
+def _search_terms(q: str) -> List[str]:
+    # keep word characters only so user input can't inject query syntax
+    return [t for t in "".join(c if c.isalnum() else " " for c in q).split() if t][:10]
+
+
+def search_matches(terms: List[str]):
+    """Return a selectable of (product_id, rank) matching all terms (prefix match),
+    where a lower rank is a better match, or None when no index is available.
+    """
+    if SEARCH_BACKEND == "fts5":
+        # column weights for bm25: name, description, subcategory, colors
+        return (
+            text(
+                "SELECT rowid AS product_id, bm25(product_search, 10.0, 1.0, 4.0, 4.0) AS rank "
+                "FROM product_search WHERE product_search MATCH :q"
+            )
+            .bindparams(q=" ".join(f'"{t}"*' for t in terms))
+            .columns(product_id=Integer, rank=Float)
+            .subquery("matches")
+        )
+    if SEARCH_BACKEND == "postgres":
+        return (
+            text(
+                "SELECT product_id, -ts_rank(document, to_tsquery('simple', :q)) AS rank "
+                "FROM product_search WHERE document @@ to_tsquery('simple', :q)"
+            )
+            .bindparams(q=" & ".join(f"{t}:*" for t in terms))
+            .columns(product_id=Integer, rank=Float)
+            .subquery("matches")
+        )
+    return None
+
+
+def load_product_documents(db: Session, product_ids: List[int]) -> dict:
+    """Return {product_id: document JSON text}. Documents that are not stored yet are
+    serialized for this response only, so read endpoints never write; product writes
+    and scripts/rebuild_product_documents.py store them.
+    """
+    documents = {}
+    for chunk in _chunks(list(product_ids), CATALOG_CHUNK_SIZE):
+        documents.update(
+            db.query(ProductDocument.product_id, ProductDocument.document)
+            .filter(ProductDocument.product_id.in_(chunk))
+            .all()
+        )
+    missing = [pid for pid in product_ids if pid not in documents]
+    for chunk in _chunks(missing, CATALOG_CHUNK_SIZE):
+        documents.update(serialize_products(db, chunk))
+    return documents
+
+
+# Products
+@app.post("/api/products")
+def create_product(product: ProductCreate):
+    db = SessionLocal()
+    try:
+        product_dict = product.dict()
+        # Handle optional fields properly
+        db_product = Product(
+            name=product_dict.get("name"),
+            category=product_dict.get("category"),
+            subcategory=product_dict.get("subcategory"),
+            description=product_dict.get("description"),
+            price=product_dict.get("price"),
+            colors=(
+                json.dumps(product_dict.get("colors"))
+                if product_dict.get("colors")
+                else None
+            ),
+            age_group=product_dict.get("age_group"),
+            # parent-level stock removed
+        )
+        db.add(db_product)
+        db.flush()
+        reindex_products(db, [db_product.id])
+        db.commit()
+        db.refresh(db_product)
+        invalidate_products()
+        return {"id": db_product.id, "message": "Product created successfully"}
+    except Exception:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Failed to create product")
+    finally:
+        db.close()
+
+
+# Keyset pagination helpers
+# Cursors are opaque to clients: a urlsafe base64 JSON list holding the sort key
+# of the last row of the previous page. The next cursor is returned in the
+# `X-Next-Cursor` response header so list responses keep their array shape.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PRODUCTS_PAGE_MAX = int(os.getenv("PRODUCTS_PAGE_MAX", "200"))
+
+
+def encode_cursor(values: list) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, length: int) -> list:
+    """Decode a cursor produced by `encode_cursor` holding `length` sort values."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        values = None
+    if not isinstance(values, list) or len(values) != length:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _split_csv(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+
+def product_filters(
+    category: Optional[str] = None,
+    subcategory: Optional[str] = None,
+    age_group: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    size: Optional[str] = Query(None, description="Comma-separated variant sizes"),
+    color: Optional[str] = Query(None, description="Comma-separated variant colors"),
+    in_stock: bool = False,
+    min_rating: Optional[float] = Query(None, ge=1, le=5, description="Minimum average rating"),
+) -> dict:
+    """Dependency collecting the product listing filters from the query string.
+    Only filters that were actually supplied are kept.
+    """
+    filters = {
+        "category": category,
+        "subcategory": subcategory,
+        "age_group": age_group,
+        "min_price": min_price,
+        "max_price": max_price,
+        "size": [s.lower() for s in _split_csv(size)],
+        "color": [c.lower() for c in _split_csv(color)],
+        "in_stock": True if in_stock else None,
+        "min_rating": min_rating,
+    }
+    # test explicitly: 0 is a valid price bound but compares equal to False
+    return {k: v for k, v in filters.items() if v is not None and not (isinstance(v, list) and not v)}
+
+
+def filters_key(filters: dict) -> tuple:
+    """Hashable, order-independent form of `product_filters` output for cache keys."""
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in filters.items()))
+
+
+VARIANT_FILTERS = ("color", "size", "in_stock")
+
+
+def size_conditions(filters: dict, size) -> list:
+    """Conditions on one `VariantSize` row (or alias) for the size and in_stock filters."""
+    conds = []
+    if "size" in filters:
+        conds.append(func.lower(size.size).in_(filters["size"]))
+    if "in_stock" in filters:
+        conds.append(size.stock > 0)
+    return conds
+
+
+def variant_conditions(filters: dict, variant) -> list:
+    """Conditions on one `Variant` row (or alias): its color, and an EXISTS over its
+    own sizes so size and in_stock hold for the same SKU.
+    """
+    conds = []
+    if "color" in filters:
+        conds.append(func.lower(variant.color).in_(filters["color"]))
+    # alias keeps the EXISTS self-contained when the outer query joins sizes too
+    sku_size = aliased(VariantSize)
+    sku_size_conds = size_conditions(filters, sku_size)
+    if sku_size_conds:
+        conds.append(exists().where(sku_size.variant_id == variant.id, *sku_size_conds))
+    return conds
+
+
+def product_conditions(filters: dict, exclude: tuple = ()) -> list:
+    """Translate product filters into SQL conditions over `Product`.
+    Variant-level filters (color, size, in_stock) are combined into a single
+    EXISTS so they must all hold for the same SKU. `exclude` drops filter
+    dimensions (used by facet counts).
+    """
+    f = {k: v for k, v in filters.items() if k not in exclude}
+    conds = []
+    if "category" in f:
+        conds.append(Product.category == f["category"])
+    if "subcategory" in f:
+        conds.append(Product.subcategory == f["subcategory"])
+    if "age_group" in f:
+        conds.append(Product.age_group == f["age_group"])
+    if "min_price" in f:
+        conds.append(Product.price >= f["min_price"])
+    if "max_price" in f:
+        conds.append(Product.price <= f["max_price"])
+    if "min_rating" in f:
+        # average >= min_rating without dividing, so unrated products never match
+        conds.append(Product.rating_count > 0)
+        conds.append(Product.rating_sum >= f["min_rating"] * Product.rating_count)
+
+    # alias keeps the EXISTS self-contained when the outer query joins variants too
+    sku = aliased(Variant)
+    sku_conds = variant_conditions(f, sku)
+    if sku_conds:
+        conds.append(exists().where(sku.product_id == Product.id, *sku_conds))
+    return conds
+
+
+PRODUCT_SORTS = ("top_rated",)
+# average rating as the fraction rating_sum / PRODUCT_RATING_DEN (unrated: 0 / 1).
+# Cursors compare fractions by integer cross-multiplication, which is exact on
+# every backend; the ordering uses the quotient of the same fraction.
+PRODUCT_RATING_DEN = case((Product.rating_count > 0, Product.rating_count), else_=1)
+PRODUCT_RATING_AVG = Product.rating_sum * 1.0 / PRODUCT_RATING_DEN
+
+
+@app.get("/api/products", response_model=List[dict])
+def get_products(
+    request: Request,
+    response: Response,
+    filters: dict = Depends(product_filters),
+    view: dict = Depends(product_view),
+    limit: Optional[int] = Query(None, ge=1, le=PRODUCTS_PAGE_MAX),
+    after: Optional[str] = None,
+    sort: Optional[str] = Query(None, description="top_rated; default is catalog order"),
+):
+    """List products, optionally filtered and keyset-paginated.
+    Pass `limit` to page; when more rows exist the cursor for the next page is
+    returned in the X-Next-Cursor header and can be sent back as `after`.
+    Use `fields`/`include` to trim the payload, e.g.
+    `?fields=id,name,price,images` skips the variant and size tables.
+    `sort=top_rated` orders by average rating, then number of ratings.
+    """
+    if sort is not None and sort not in PRODUCT_SORTS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort: {sort}. Allowed: {', '.join(PRODUCT_SORTS)}")
+    db = SessionLocal()
+    try:
+        version = listing_version(db)
+        not_modified = conditional_get(request, response, version)
+        if not_modified:
+            return not_modified
+
+        cache_key = (
+            "products",
+            version,
+            filters_key(filters),
+            view_key(view),
+            limit,
+            after,
+            sort,
+        )
+        cached = catalog_cache.get(cache_key)
+        if cached is not None:
+            payload, next_cursor = cached
+            if next_cursor:
+                response.headers[NEXT_CURSOR_HEADER] = next_cursor
+            return json_response(payload, response)
+
+        generation = catalog_cache.generation
+        columns = product_columns(view)
+        if sort == "top_rated":
+            # the cursor is built from the aggregates
+            columns += [Product.rating_count, Product.rating_sum]
+        query = (
+            db.query(Product)
+            .options(load_only(*columns))
+            .filter(*product_conditions(filters))
+        )
+        if sort == "top_rated":
+            if after:
+                cursor = decode_cursor(after, 3)
+                if not all(isinstance(v, int) and v >= 0 for v in cursor):
+                    raise HTTPException(status_code=400, detail="Invalid cursor")
+                last_sum, last_count, last_id = cursor
+                # avg < last avg  <=>  rating_sum * last_den < last_sum * den
+                lhs = Product.rating_sum * max(last_count, 1)
+                rhs = last_sum * PRODUCT_RATING_DEN
+                query = query.filter(
+                    or_(
+                        lhs < rhs,
+                        and_(lhs == rhs, Product.rating_count < last_count),
+                        and_(lhs == rhs, Product.rating_count == last_count, Product.id > last_id),
+                    )
+                )
+            query = query.order_by(PRODUCT_RATING_AVG.desc(), Product.rating_count.desc(), Product.id)
+        else:
+            if after:
+                (last_id,) = decode_cursor(after, 1)
+                if not isinstance(last_id, int):
+                    raise HTTPException(status_code=400, detail="Invalid cursor")
+                query = query.filter(Product.id > last_id)
+            query = query.order_by(Product.id)
+        next_cursor = None
+        if limit:
+            products = query.limit(limit + 1).all()
+            if len(products) > limit:
+                products = products[:limit]
+                last = products[-1]
+                if sort == "top_rated":
+                    next_cursor = encode_cursor([last.rating_sum or 0, last.rating_count or 0, last.id])
+                else:
+                    next_cursor = encode_cursor([last.id])
+                response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        else:
+            products = query.all()
+        payload = load_catalog(db, products, view)
+        catalog_cache.set(cache_key, (payload, next_cursor), ("products",), generation)
+        return json_response(payload, response)
+    finally:
+        db.close()
+
+
+# Image upload endpoint: uploads to Cloudinary if configured, otherwise saves locally to backend/static/uploads
+@app.post("/api/upload")
+def upload_image(file: UploadFile = File(...)):
+    """Accepts a multipart file and returns JSON { image_url: ... }.
+    Requires CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, CLOUDINARY_API_SECRET env vars to upload to Cloudinary.
+    Falls back to saving the file under backend/static/uploads and returning a local path URL.
+    """
+    # Prefer Cloudinary when available and configured
+    cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME")
+    cloud_key = os.getenv("CLOUDINARY_API_KEY")
+    cloud_secret = os.getenv("CLOUDINARY_API_SECRET")
+    try:
+        contents = file.file.read()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to read uploaded file: {e}")
+
+    if cloudinary and cloud_name and cloud_key and cloud_secret:
+        try:
+            cloudinary.config(
+                cloud_name=cloud_name,
+                api_key=cloud_key,
+                api_secret=cloud_secret,
+                secure=True,
+            )
+            # upload accepts a file-like object; wrap bytes in BytesIO
+            res = cloudinary.uploader.upload(io.BytesIO(contents), resource_type="image")
+            image_url = res.get("secure_url") or res.get("url")
+            return {"image_url": image_url}
+        except Exception as e:
+            # fallback to local storage if Cloudinary fails
+            logging.exception("Cloudinary upload failed")
+
+    # Local fallback: save under backend/static/uploads
+    uploads_dir = os.path.join(os.path.dirname(__file__), "static", "uploads")
+    os.makedirs(uploads_dir, exist_ok=True)
+    filename = f"{int(datetime.utcnow().timestamp())}_{os.path.basename(file.filename)}"
+    dest_path = os.path.join(uploads_dir, filename)
+    try:
+        with open(dest_path, "wb") as f:
+            f.write(contents)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save file locally: {e}")
+
+    # Return relative path the frontend can use (assumes static files served from /static)
+    image_url = f"/static/uploads/{filename}"
+    return {"image_url": image_url}
+
+
+# Price bucket boundaries (rupees) for the facet sidebar; the last bucket is open-ended
+PRICE_BUCKETS = [0, 500, 1000, 2000, 5000]
+
+
+def _facet_rows(rows) -> List[dict]:
+    return [
+        {"value": value, "count": count}
+        for value, count in sorted(rows, key=lambda r: (-r[1], str(r[0])))
+        if value is not None
+    ]
+
+
+def compute_facets(db: Session, filters: dict) -> dict:
+    """Count matching products per facet value with one grouped query per facet.
+    Each facet ignores its own filter (so other values stay selectable) but
+    honours all the others.
+    """
+    def base(exclude, *columns):
+        return db.query(*columns).filter(*product_conditions(filters, exclude=exclude))
+
+    distinct_products = func.count(func.distinct(Product.id))
+    facets = {}
+    for dim, col in (
+        ("category", Product.category),
+        ("subcategory", Product.subcategory),
+        ("age_group", Product.age_group),
+    ):
+        facets[dim] = _facet_rows(base((dim,), col, func.count(Product.id)).group_by(col).all())
+
+    # color and size are counted over the variants and sizes that satisfy the other
+    # variant-level filters themselves, not over every SKU of a matching product
+    def only(*dims):
+        return {k: v for k, v in filters.items() if k in dims}
+
+    color_rows = (
+        base(VARIANT_FILTERS, func.min(Variant.color), distinct_products)
+        .join(Variant, Variant.product_id == Product.id)
+        .filter(*variant_conditions(only("size", "in_stock"), Variant))
+        .group_by(func.lower(Variant.color))
+        .all()
+    )
+    facets["color"] = _facet_rows(color_rows)
+
+    size_rows = (
+        base(VARIANT_FILTERS, VariantSize.size, distinct_products)
+        .join(Variant, Variant.product_id == Product.id)
+        .join(VariantSize, VariantSize.variant_id == Variant.id)
+        .filter(
+            *variant_conditions(only("color"), Variant),
+            *size_conditions(only("in_stock"), VariantSize),
+        )
+        .group_by(VariantSize.size)
+        .all()
+    )
+    facets["size"] = _facet_rows(size_rows)
+
+    bucket = case(
+        *[(Product.price < upper, i) for i, upper in enumerate(PRICE_BUCKETS[1:])],
+        else_=len(PRICE_BUCKETS) - 1,
+    )
+    counts = dict(
+        base(("min_price", "max_price"), bucket, func.count(Product.id))
+        .filter(Product.price.isnot(None))
+        .group_by(bucket)
+        .all()
+    )
+    facets["price"] = [
+        {
+            "min": lower,
+            "max": PRICE_BUCKETS[i + 1] if i + 1 < len(PRICE_BUCKETS) else None,
+            "count": counts.get(i, 0),
+        }
+        for i, lower in enumerate(PRICE_BUCKETS)
+    ]
+    return facets
+
+
+@app.get("/api/products/facets")
+def get_product_facets(
+    request: Request,
+    response: Response,
+    filters: dict = Depends(product_filters),
+):
+    """Facet counts (category, subcategory, age group, color, size, price bucket)
+    for the store filter sidebars, respecting the currently applied filters.
+    """
+    db = SessionLocal()
+    try:
+        version = listing_version(db)
+        not_modified = conditional_get(request, response, version)
+        if not_modified:
+            return not_modified
+
+        cache_key = (
+            "facets",
+            version,
+            filters_key(filters),
+        )
+        cached = catalog_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        generation = catalog_cache.generation
+        payload = compute_facets(db, filters)
+        catalog_cache.set(cache_key, payload, ("products",), generation)
+        return payload
+    finally:
+        db.close()
+
+
+@app.get("/api/products/search", response_model=List[dict])
+def search_products(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    filters: dict = Depends(product_filters),
+    view: dict = Depends(product_view),
+    limit: int = Query(20, ge=1, le=PRODUCTS_PAGE_MAX),
+    after: Optional[str] = None,
+):
+    """Ranked full-text search over product name, description, subcategory and
+    variant colors. Accepts the listing filters; pages with `limit`/`after` and
+    returns the next cursor in the X-Next-Cursor header.
+    """
+    terms = _search_terms(q)
+    if not terms:
+        return []
+    offset = 0
+    if after:
+        (offset,) = decode_cursor(after, 1)
+        if not isinstance(offset, int) or offset < 0:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    db = SessionLocal()
+    try:
+        not_modified = conditional_get(request, response, listing_version(db))
+        if not_modified:
+            return not_modified
+
+        matches = search_matches(terms)
+        if matches is not None:
+            query = (
+                db.query(Product.id)
+                .join(matches, matches.c.product_id == Product.id)
+                .order_by(matches.c.rank, Product.id)
+            )
+        else:
+            query = db.query(Product.id).order_by(Product.id)
+            for t in terms:
+                pattern = f"%{t}%"
+                query = query.filter(
+                    or_(
+                        Product.name.ilike(pattern),
+                        Product.description.ilike(pattern),
+                        Product.subcategory.ilike(pattern),
+                    )
+                )
+        query = query.filter(*product_conditions(filters))
+        ids = [pid for (pid,) in query.offset(offset).limit(limit + 1).all()]
+        if len(ids) > limit:
+            ids = ids[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor([offset + limit])
+        documents = load_product_documents(db, ids)
+        return [project_product(json.loads(documents[pid]), view) for pid in ids if pid in documents]
+    finally:
+        db.close()
+
+
+# Bulk hydration for cart, wishlist and order views: many products by id in
+# one pass over product_documents instead of one request per product.
+PRODUCTS_BATCH_MAX = int(os.getenv("PRODUCTS_BATCH_MAX", "200"))
+
+
+def _batch_ids(values: list) -> List[int]:
+    """Validate and de-duplicate requested ids, keeping their order."""
+    ids = []
+    for value in values:
+        try:
+            pid = int(value)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail=f"Invalid product id: {value}")
+        if pid not in ids:
+            ids.append(pid)
+    if not ids:
+        raise HTTPException(status_code=400, detail="No product ids given")
+    if len(ids) > PRODUCTS_BATCH_MAX:
+        raise HTTPException(
+            status_code=400, detail=f"At most {PRODUCTS_BATCH_MAX} product ids per request"
+        )
+    return ids
+
+
+def product_batch(db: Session, ids: List[int], view: dict) -> dict:
+    """{"products": [...] in request order, "missing": [ids that do not exist]}."""
+    documents = load_product_documents(db, ids)
+    return {
+        "products": [project_product(json.loads(documents[pid]), view) for pid in ids if pid in documents],
+        "missing": [pid for pid in ids if pid not in documents],
+    }
+
+
+@app.get("/api/products/batch")
+def get_products_batch(
+    request: Request,
+    response: Response,
+    ids: str = Query(..., description="Comma-separated product ids"),
+    view: dict = Depends(product_view),
+):
+    """Products for a list of ids, with variants and per-size stock.
+    Ids that do not exist are reported under "missing".
+    """
+    product_ids = _batch_ids(_split_csv(ids))
+    db = SessionLocal()
+    try:
+        not_modified = conditional_get(request, response, listing_version(db))
+        if not_modified:
+            return not_modified
+        return json_response(product_batch(db, product_ids, view), response)
+    finally:
+        db.close()
+
+
+@app.post("/api/products/batch")
+def post_products_batch(body: ProductBatchRequest, view: dict = Depends(product_view)):
+    """Same as GET /api/products/batch, for id lists too long for a query string."""
+    product_ids = _batch_ids(body.ids)
+    db = SessionLocal()
+    try:
+        return json_response(product_batch(db, product_ids, view))
+    finally:
+        db.close()
+
+
+def product_version(db: Session, product_id: int) -> str:
+    """Version token of one product's detail response: the catalog version plus
+    when its document was stored. Raises 404 for a product that does not exist,
+    so a deleted id never revalidates to 304.
+    """
+    stored_at = (
+        db.query(ProductDocument.updated_at).filter(ProductDocument.product_id == product_id).scalar()
+    )
+    if stored_at is None and not db.query(exists().where(Product.id == product_id)).scalar():
+        raise HTTPException(status_code=404, detail=PRODUCT_NOT_FOUND)
+    stamp = stored_at.timestamp() if stored_at else 0
+    return f"{catalog_version(db, 'products')}.{stamp}"
+
+
+@app.get("/api/products/{product_id}")
+def get_product(
+    product_id: int,
+    request: Request,
+    response: Response,
+    view: dict = Depends(product_view),
+):
+    db = SessionLocal()
+    try:
+        version = product_version(db, product_id)
+        not_modified = conditional_get(request, response, version)
+        if not_modified:
+            return not_modified
+
+        cache_key = ("product", version, product_id)
+        document = catalog_cache.get(cache_key)
+        if document is None:
+            generation = catalog_cache.generation
+            # serialized in memory when not stored yet (e.g. rows written outside the API)
+            document = load_product_documents(db, [product_id]).get(product_id)
+            if document is None:
+                raise HTTPException(status_code=404, detail=PRODUCT_NOT_FOUND)
+            catalog_cache.set(cache_key, document, (f"product:{product_id}",), generation)
+        if view != FULL_PRODUCT_VIEW:
+            return json_response(project_product(json.loads(document), view), response)
+        # the stored document is already JSON; send it without re-encoding
+        return Response(content=document, media_type="application/json", headers=dict(response.headers))
+    finally:
+        db.close()
+
+
+# Catalog export for marketplace feeds: one row per SKU (product x variant x size)
+EXPORT_COLUMNS = [
+    "sku",
+    "product_id",
+    "name",
+    "category",
+    "subcategory",
+    "description",
+    "price",
+    "age_group",
+    "variant_id",
+    "color",
+    "color_code",
+    "size",
+    "stock",
+    "in_stock",
+    "image_url",
+]
+EXPORT_BATCH_SIZE = 1000
+
+
+def iter_catalog_skus():
+    """Yield one flattened dict per SKU, streaming rows from a server-side cursor
+    so memory stays flat regardless of catalog size. Products without variants or
+    sizes still produce a row with the variant columns left empty.
+    """
+    first_image = (
+        select(VariantImage.image_url)
+        .where(VariantImage.variant_id == Variant.id)
+        .order_by(VariantImage.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(
+            Product.id,
+            Product.name,
+            Product.category,
+            Product.subcategory,
+            Product.description,
+            Product.price,
+            Product.age_group,
+            Variant.id,
+            Variant.color,
+            Variant.color_code,
+            VariantSize.size,
+            VariantSize.stock,
+            first_image,
+        )
+        .outerjoin(Variant, Variant.product_id == Product.id)
+        .outerjoin(VariantSize, VariantSize.variant_id == Variant.id)
+        .order_by(Product.id, Variant.id, VariantSize.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    db = SessionLocal()
+    try:
+        for row in db.execute(stmt):
+            (pid, name, category, subcategory, description, price, age_group,
+             vid, color, color_code, size, stock, image_url) = row
+            yield {
+                "sku": "-".join(str(part) for part in (pid, vid, size) if part is not None),
+                "product_id": pid,
+                "name": name,
+                "category": category,
+                "subcategory": subcategory,
+                "description": description,
+                "price": price,
+                "age_group": age_group,
+                "variant_id": vid,
+                "color": color,
+                "color_code": color_code,
+                "size": size,
+                "stock": stock,
+                "in_stock": bool(stock and stock > 0),
+                "image_url": image_url,
+            }
+    finally:
+        db.close()
+
+
+def _export_ndjson():
+    buf = []
+    for row in iter_catalog_skus():
+        buf.append(json.dumps(row, separators=(",", ":")))
+        if len(buf) >= EXPORT_BATCH_SIZE:
+            yield "\n".join(buf) + "\n"
+            buf = []
+    if buf:
+        yield "\n".join(buf) + "\n"
+
+
+def _export_csv():
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for i, row in enumerate(iter_catalog_skus(), start=1):
+        writer.writerow(row)
+        if i % EXPORT_BATCH_SIZE == 0:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate(0)
+    yield out.getvalue()
+
+
+@app.get("/api/admin/products/export")
+def admin_export_products(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    admin_user: User = Depends(get_current_admin),
+):
+    """Stream the catalog flattened per SKU as NDJSON or CSV (admin only)."""
+    if export_format == "csv":
+        body, media_type = _export_csv(), "text/csv"
+    else:
+        body, media_type = _export_ndjson(), "application/x-ndjson"
+    filename = f"vruksha-catalog-{datetime.utcnow().strftime('%Y%m%d')}.{export_format}"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+# Catalog import for supplier onboarding. Accepts the export's flat per-SKU rows
+# (CSV or NDJSON; rows of one product must be contiguous and share `product_id`,
+# or `name` when that column is empty) and, in NDJSON, whole product objects with
+# nested `variants`. Each product is validated with ProductCreate / VariantCreate;
+# valid products are inserted in executemany batches, one transaction per batch.
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_ERRORS = 1000
+_PRODUCT_IMPORT_FIELDS = ("name", "category", "subcategory", "description", "price", "age_group", "colors")
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in exc.errors()
+    )
+
+
+def _read_import_rows(stream, import_format: str):
+    """Yield (row number, dict) from the uploaded file without loading it whole."""
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if import_format == "csv":
+        for number, row in enumerate(csv.DictReader(text_stream), start=2):
+            yield number, {k: v for k, v in row.items() if k is not None}
+        return
+    for number, line in enumerate(text_stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield number, exc
+            continue
+        yield number, row if isinstance(row, dict) else ValueError("expected a JSON object")
+
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _group_import_products(rows):
+    """Fold flat SKU rows into product payloads. Yields (row numbers, payload or
+    error message); nested NDJSON products pass through unchanged.
+    """
+    group_key, numbers, product, variants = None, [], None, {}
+
+    def flush():
+        if product is not None:
+            product["variants"] = list(variants.values())
+            return numbers, product
+        return None
+
+    for number, row in rows:
+        if isinstance(row, Exception):
+            yield [number], f"unreadable row: {row}"
+            continue
+        if "variants" in row:
+            pending = flush()
+            if pending:
+                yield pending
+            group_key, numbers, product, variants = None, [], None, {}
+            yield [number], row
+            continue
+        key = row.get("product_id") if not _blank(row.get("product_id")) else row.get("name")
+        if product is None or key != group_key:
+            pending = flush()
+            if pending:
+                yield pending
+            group_key, numbers, variants = key, [], {}
+            product = {f: row.get(f) for f in _PRODUCT_IMPORT_FIELDS if not _blank(row.get(f))}
+        numbers.append(number)
+        color = row.get("color")
+        if _blank(color):
+            continue
+        variant = variants.setdefault(
+            color, {"color": color, "color_code": row.get("color_code") or None, "images": [], "sizes": []}
+        )
+        images = row.get("images")
+        if isinstance(images, str):
+            images = images.split("|")
+        for url in ([row.get("image_url")] if not _blank(row.get("image_url")) else []) + list(images or []):
+            if not _blank(url) and url not in variant["images"]:
+                variant["images"].append(url.strip())
+        if not _blank(row.get("size")):
+            variant["sizes"].append({"size": row["size"], "stock": 0 if _blank(row.get("stock")) else row["stock"]})
+    pending = flush()
+    if pending:
+        yield pending
+
+
+def _insert_import_batch(db: Session, batch: list) -> tuple:
+    """Insert validated (ProductCreate, [VariantCreate]) pairs with executemany
+    statements and reindex them. Returns (products, variants, skus) inserted.
+    """
+    product_ids = db.execute(
+        insert(Product).returning(Product.id, sort_by_parameter_order=True),
+        [
+            {
+                "name": p.name,
+                "category": p.category,
+                "subcategory": p.subcategory,
+                "description": p.description,
+                "price": p.price,
+                "age_group": p.age_group,
+                "colors": json.dumps(p.colors) if p.colors else None,
+            }
+            for p, _ in batch
+        ],
+    ).scalars().all()
+    variant_rows = [
+        {"product_id": pid, "color": v.color, "color_code": v.color_code}
+        for pid, (_, variants) in zip(product_ids, batch)
+        for v in variants
+    ]
+    variant_ids = []
+    if variant_rows:
+        variant_ids = db.execute(
+            insert(Variant).returning(Variant.id, sort_by_parameter_order=True), variant_rows
+        ).scalars().all()
+    variants = [v for _, product_variants in batch for v in product_variants]
+    images = [
+        {"variant_id": vid, "image_url": url} for vid, v in zip(variant_ids, variants) for url in v.images or []
+    ]
+    sizes = [
+        {"variant_id": vid, "size": s.size, "stock": int(s.stock)}
+        for vid, v in zip(variant_ids, variants)
+        for s in v.sizes or []
+    ]
+    if images:
+        db.execute(insert(VariantImage), images)
+    if sizes:
+        db.execute(insert(VariantSize), sizes)
+    reindex_products(db, product_ids)
+    return len(product_ids), len(variant_ids), len(sizes)
+
+
+def import_products(db: Session, stream, import_format: str, dry_run: bool = False) -> dict:
+    """Validate and import a CSV/NDJSON catalog file; returns counts, per-row
+    errors and throughput.
+    """
+    started = time.perf_counter()
+    stats = {"rows": 0, "products_created": 0, "variants_created": 0, "skus_created": 0}
+    errors, error_count = [], 0
+    batch, batch_rows = [], []
+
+    def record(rows, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append({"rows": rows, "error": message})
+
+    def commit_batch():
+        if not batch or dry_run:
+            return
+        try:
+            products, variants, skus = _insert_import_batch(db, batch)
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            record([n for rows in batch_rows for n in rows], f"batch failed: {exc.__class__.__name__}")
+            return
+        stats["products_created"] += products
+        stats["variants_created"] += variants
+        stats["skus_created"] += skus
+
+    for numbers, payload in _group_import_products(_read_import_rows(stream, import_format)):
+        stats["rows"] += len(numbers)
+        if isinstance(payload, str):
+            record(numbers, payload)
+            continue
+        try:
+            product = ProductCreate(**payload)
+            variants = []
+            for i, variant in enumerate(payload.get("variants") or []):
+                try:
+                    variants.append(VariantCreate(**variant))
+                except ValidationError as exc:
+                    raise ValueError(f"variants.{i}.{_validation_message(exc)}")
+        except ValidationError as exc:
+            record(numbers, _validation_message(exc))
+            continue
+        except ValueError as exc:
+            record(numbers, str(exc))
+            continue
+        batch.append((product, variants))
+        batch_rows.append(numbers)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            commit_batch()
+            batch, batch_rows = [], []
+    commit_batch()
+
+    elapsed = time.perf_counter() - started
+    stats.update(
+        dry_run=dry_run,
+        error_count=error_count,
+        errors=errors,
+        elapsed_seconds=round(elapsed, 3),
+        rows_per_second=round(stats["rows"] / elapsed) if elapsed else None,
+    )
+    return stats
+
+
+@app.post("/api/admin/products/import")
+def admin_import_products(
+    file: UploadFile = File(...),
+    import_format: Optional[str] = Query(None, alias="format", pattern="^(ndjson|csv)$"),
+    dry_run: bool = False,
+    admin_user: User = Depends(get_current_admin),
+):
+    """Import products, variants, images and size stock from a CSV or NDJSON
+    upload (admin only). The format defaults from the file extension. Invalid
+    products are skipped and reported per row; `dry_run` validates only.
+    """
+    if import_format is None:
+        import_format = "csv" if (file.filename or "").lower().endswith(".csv") else "ndjson"
+    db = SessionLocal()
+    try:
+        result = import_products(db, file.file, import_format, dry_run=dry_run)
+    finally:
+        db.close()
+    if result["products_created"]:
+        invalidate_products()
+    return result
+
+
+# Bulk inventory adjustments (stock-takes): thousands of (variant_id, size) rows
+# applied to VariantSize in one transaction with a single executemany UPDATE.
+INVENTORY_BULK_MAX = int(os.getenv("INVENTORY_BULK_MAX", "10000"))
+
+
+@app.post("/api/admin/inventory/bulk")
+def admin_bulk_inventory(
+    payload: InventoryBulkRequest,
+    admin_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db),
+):
+    """Apply stock corrections per (variant_id, size). Rows for the same size are
+    applied in order. Returns one result per row; rows that fail (unknown size,
+    both/neither of delta and stock, stock below zero) are reported and skipped.
+    With `all_or_nothing` any failed row aborts the batch with 422 and the results.
+    """
+    if len(payload.rows) > INVENTORY_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {INVENTORY_BULK_MAX} rows per request")
+
+    # lock the affected rows (Postgres) so concurrent checkouts cannot interleave
+    variant_ids = sorted({row.variant_id for row in payload.rows})
+    current = {}
+    for chunk in _chunks(variant_ids, CATALOG_CHUNK_SIZE):
+        for size_id, variant_id, size, stock, product_id in (
+            db.query(VariantSize.id, VariantSize.variant_id, VariantSize.size, VariantSize.stock, Variant.product_id)
+            .join(Variant, Variant.id == VariantSize.variant_id)
+            .filter(VariantSize.variant_id.in_(chunk))
+            .order_by(VariantSize.id)
+            .with_for_update(of=VariantSize)
+        ):
+            current.setdefault((variant_id, size), {"id": size_id, "stock": stock or 0, "product_id": product_id})
+
+    results, stock_after, failed = [], {}, 0
+    for i, row in enumerate(payload.rows):
+        result = {"row": i, "variant_id": row.variant_id, "size": row.size}
+        target = current.get((row.variant_id, row.size))
+        error = None
+        if (row.delta is None) == (row.stock is None):
+            error = "give exactly one of delta or stock"
+        elif target is None:
+            error = "unknown variant/size"
+        else:
+            previous = stock_after.get(target["id"], target["stock"])
+            new_stock = row.stock if row.stock is not None else previous + row.delta
+            if new_stock < 0:
+                error = f"stock would become negative ({new_stock})"
+        if error:
+            failed += 1
+            result.update(status="error", error=error)
+        else:
+            stock_after[target["id"]] = new_stock
+            result.update(status="ok", previous=previous, stock=new_stock)
+        results.append(result)
+
+    if failed and payload.all_or_nothing:
+        db.rollback()
+        raise HTTPException(
+            status_code=422,
+            detail={"error": "invalid_rows", "applied": 0, "failed": failed, "results": results},
+        )
+
+    original = {target["id"]: target for target in current.values()}
+    changed = [
+        {"id": size_id, "stock": stock}
+        for size_id, stock in stock_after.items()
+        if stock != original[size_id]["stock"]
+    ]
+    product_ids = sorted({original[row["id"]]["product_id"] for row in changed})
+    if changed:
+        db.execute(update(VariantSize), changed)
+        reindex_products(db, product_ids)
+    db.commit()
+    if changed:
+        invalidate_products(*product_ids)
+    return {"applied": len(results) - failed, "failed": failed, "results": results}
+
+
+# Variant backfill: creates variants (and their images) from the legacy `colors`
+# column for products that have none. Runs as a background job in chunks; each
+# chunk selects its products with one anti-join and is committed together with
+# the job's progress, so a restarted job continues after the last finished chunk.
+BACKFILL_CHUNK_SIZE = int(os.getenv("BACKFILL_CHUNK_SIZE", "500"))
+# a running job that has not reported progress for this long is considered dead
+BACKFILL_STALE_SECONDS = int(os.getenv("BACKFILL_STALE_SECONDS", "300"))
+
+
+def _legacy_variant_rows(product_id: int, colors_json: Optional[str]) -> list:
+    """(variant row, image urls) pairs for one product's legacy colors."""
+    try:
+        colors = json.loads(colors_json) if colors_json else None
+    except Exception:
+        colors = None
+    if not colors:
+        # single default variant (no images) when legacy colors are absent
+        return [({"product_id": product_id, "color": "Default", "color_code": None}, [])]
+    return [
+        (
+            {"product_id": product_id, "color": c.get("name") or "Variant", "color_code": c.get("hex")},
+            c.get("images") or [],
+        )
+        for c in colors
+    ]
+
+
+def backfill_variants_chunk(db: Session, after_id: int, limit: int) -> tuple:
+    """Backfill the next `limit` products without variants after `after_id`
+    (caller commits). Returns (product ids, variants created).
+    """
+    rows = db.execute(
+        select(Product.id, Product.colors)
+        .where(Product.id > after_id, ~exists().where(Variant.product_id == Product.id))
+        .order_by(Product.id)
+        .limit(limit)
+    ).all()
+    if not rows:
+        return [], 0
+    pending = [pair for pid, colors in rows for pair in _legacy_variant_rows(pid, colors)]
+    variant_ids = db.execute(
+        insert(Variant).returning(Variant.id, sort_by_parameter_order=True),
+        [variant for variant, _ in pending],
+    ).scalars().all()
+    images = [
+        {"variant_id": vid, "image_url": url}
+        for vid, (_, urls) in zip(variant_ids, pending)
+        for url in urls
+    ]
+    if images:
+        db.execute(insert(VariantImage), images)
+    product_ids = [pid for pid, _ in rows]
+    reindex_products(db, product_ids)
+    return product_ids, len(variant_ids)
+
+
+def serialize_backfill_job(job: BackfillJob, remaining: Optional[int] = None) -> dict:
+    out = {
+        "id": job.id,
+        "name": job.name,
+        "status": job.status,
+        "last_product_id": job.last_product_id,
+        "products_done": job.products_done,
+        "variants_created": job.variants_created,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if remaining is not None:
+        out["remaining_products"] = remaining
+    return out
+
+
+def products_without_variants(db: Session) -> int:
+    return (
+        db.query(func.count(Product.id))
+        .filter(~exists().where(Variant.product_id == Product.id))
+        .scalar()
+    )
+
+
+def start_variant_backfill(db: Session) -> tuple:
+    """Claim the variant backfill: resume the latest unfinished job or create a
+    new one. Returns (job, started); `started` is False when another worker is
+    already running it.
+    """
+    now = datetime.utcnow()
+    job = (
+        db.query(BackfillJob)
+        .filter(BackfillJob.name == "variants", BackfillJob.status != "completed")
+        .order_by(BackfillJob.id.desc())
+        .first()
+    )
+    if job is None:
+        job = BackfillJob(name="variants", status="running", created_at=now, updated_at=now)
+        db.add(job)
+        db.commit()
+        return job, True
+    # conditional claim so two workers cannot both resume the same job
+    claimed = (
+        db.query(BackfillJob)
+        .filter(
+            BackfillJob.id == job.id,
+            or_(
+                BackfillJob.status != "running",
+                BackfillJob.updated_at < now - timedelta(seconds=BACKFILL_STALE_SECONDS),
+            ),
+        )
+        .update({"status": "running", "error": None, "updated_at": now}, synchronize_session=False)
+    )
+    db.commit()
+    db.refresh(job)
+    return job, bool(claimed)
+
+
+def run_variant_backfill(job_id: int):
+    """Background task: process chunks until no product is left without variants."""
+    db = SessionLocal()
+    try:
+        job = db.get(BackfillJob, job_id)
+        while True:
+            try:
+                product_ids, created = backfill_variants_chunk(db, job.last_product_id, BACKFILL_CHUNK_SIZE)
+                if product_ids:
+                    job.last_product_id = product_ids[-1]
+                    job.products_done += len(product_ids)
+                    job.variants_created += created
+                else:
+                    job.status = "completed"
+                    job.finished_at = datetime.utcnow()
+                job.updated_at = datetime.utcnow()
+                db.commit()
+            except Exception as exc:
+                db.rollback()
+                job.status = "failed"
+                job.error = f"{exc.__class__.__name__}: {exc}"[:1000]
+                job.updated_at = datetime.utcnow()
+                db.commit()
+                logger.warning(f"Variant backfill job {job_id} failed: {exc}")
+                return
+            if not product_ids:
+                return
+            invalidate_products(*product_ids)
+    finally:
+        db.close()
+
+
+def _launch_variant_backfill(db: Session, background_tasks: BackgroundTasks, response: Response) -> dict:
+    job, started = start_variant_backfill(db)
+    if started:
+        background_tasks.add_task(run_variant_backfill, job.id)
+        response.status_code = status.HTTP_202_ACCEPTED
+    return serialize_backfill_job(job)
+
+
+@app.post("/api/admin/variants/backfill")
+def admin_backfill_variants(
+    background_tasks: BackgroundTasks,
+    response: Response,
+    admin_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db),
+):
+    """Start (or resume) the background job that backfills variants from the legacy
+    `colors` column for products without variants. Idempotent: products that
+    already have variants are skipped, and an already running job is returned as is.
+    Poll GET /api/admin/variants/backfill for progress.
+    """
+    return _launch_variant_backfill(db, background_tasks, response)
+
+
+@app.get("/api/admin/variants/backfill")
+def admin_backfill_variants_status(
+    admin_user: User = Depends(get_current_admin), db: Session = Depends(get_db)
+):
+    """Status of the most recent variant backfill job, with the number of products
+    still without variants.
+    """
+    job = (
+        db.query(BackfillJob)
+        .filter(BackfillJob.name == "variants")
+        .order_by(BackfillJob.id.desc())
+        .first()
+    )
+    if job is None:
+        return {"status": "never_run", "remaining_products": products_without_variants(db)}
+    return serialize_backfill_job(job, remaining=products_without_variants(db))
+
+
+@app.post("/api/dev/variants/backfill")
+def dev_backfill_variants(
+    background_tasks: BackgroundTasks, response: Response, db: Session = Depends(get_db)
+):
+    """Development backfill endpoint. Starts the same backfill job but without admin auth.
+    This endpoint is gated by an environment variable for safety. Set DEV=1 or ALLOW_DEV_BACKFILL=1 to enable.
+    """
+    if os.getenv("DEV", "0") not in ("1", "true", "yes") and os.getenv(
+        "ALLOW_DEV_BACKFILL", "0"
+    ) not in (
+        "1",
+        "true",
+        "yes",
+    ):
+        raise HTTPException(
+            status_code=403, detail="Dev backfill disabled. Set DEV=1 to enable."
+        )
+    return _launch_variant_backfill(db, background_tasks, response)
+
+
+@app.post("/api/dev/create_demo_product")
+def dev_create_demo_product(db: Session = Depends(get_db)):
+    """Create a demo product with two variants (Red/Blue) for local testing.
+    Gated by DEV=1 or ALLOW_DEV_BACKFILL=1.
+    """
+    # if os.getenv("DEV", "0") not in ("1", "true", "yes") and os.getenv("ALLOW_DEV_BACKFILL", "0") not in (
+    #     "1",
+    #     "true",
+    #     "yes",
+    # ):
+    #     raise HTTPException(status_code=403, detail="Dev endpoints disabled. Set DEV=1 to enable.")
+
+    demo_name = "Demo Tee - Two Color"
+    demo = db.query(Product).filter(Product.name == demo_name).first()
     if demo:
         # Return the existing product serialization
-        try:
-            return get_product(demo.id)
-        except Exception:
-            return {"ok": True, "message": "Demo already exists", "id": demo.id}
+        return load_catalog(db, [demo])[0]
 
     # create product
     demo = Product(
@@ -1419,36 +3428,30 @@ def dev_create_demo_product(db: Session = Depends(get_db)):
         # parent image/size/stock removed - variants store images and sizes
     )
     db.add(demo)
-    db.commit()
-    db.refresh(demo)
+    db.flush()
 
     # Variant 1: Red
     v1 = Variant(product_id=demo.id, color="Red", color_code="#e53935")
-    db.add(v1)
-    db.commit()
-    db.refresh(v1)
-    vi1 = VariantImage(variant_id=v1.id, image_url=DEMO_IMG_1)
-    db.add(vi1)
-    db.add(VariantSize(variant_id=v1.id, size="S", stock=5))
-    db.add(VariantSize(variant_id=v1.id, size="M", stock=7))
-
     # Variant 2: Blue
     v2 = Variant(product_id=demo.id, color="Blue", color_code="#1e88e5")
-    db.add(v2)
-    db.commit()
-    db.refresh(v2)
-    vi2 = VariantImage(variant_id=v2.id, image_url=DEMO_IMG_2)
-    db.add(vi2)
-    db.add(VariantSize(variant_id=v2.id, size="S", stock=3))
-    db.add(VariantSize(variant_id=v2.id, size="M", stock=6))
-
+    db.add_all([v1, v2])
+    db.flush()
+    db.add_all(
+        [
+            VariantImage(variant_id=v1.id, image_url=DEMO_IMG_1),
+            VariantSize(variant_id=v1.id, size="S", stock=5),
+            VariantSize(variant_id=v1.id, size="M", stock=7),
+            VariantImage(variant_id=v2.id, image_url=DEMO_IMG_2),
+            VariantSize(variant_id=v2.id, size="S", stock=3),
+            VariantSize(variant_id=v2.id, size="M", stock=6),
+        ]
+    )
+    reindex_products(db, [demo.id])
     db.commit()
+    invalidate_products(demo.id)
 
     # Return serialized product
-    try:
-        return get_product(demo.id)
-    except Exception:
-        return {"ok": True, "id": demo.id}
+    return load_catalog(db, [demo])[0]
 
 
 @app.post("/api/admin/products/{product_id}/variants", response_model=VariantResponse)
@@ -1480,7 +3483,10 @@ def admin_create_variant(
         vs = VariantSize(variant_id=v.id, size=s.size, stock=int(s.stock))
         db.add(vs)
         sizes.append({"size": s.size, "stock": int(s.stock)})
+    db.flush()
+    reindex_products(db, [product.id])
     db.commit()
+    invalidate_products(product.id)
     return VariantResponse(
         id=v.id,
         product_id=product.id,
@@ -1502,15 +3508,30 @@ def create_review(
     db_prod = db.query(Product).filter(Product.id == product_id).first()
     if not db_prod:
         raise HTTPException(status_code=404, detail=PRODUCT_NOT_FOUND)
+    rating = payload.rating or 5
     review = Review(
         product_id=product_id,
         user_name=payload.user_name or current_user.name or "Anonymous",
-        rating=payload.rating or 5,
+        rating=rating,
         text=payload.text,
     )
     db.add(review)
+    # bump the aggregates in SQL so concurrent reviews cannot lose updates
+    star = getattr(Product, f"rating_{rating}")
+    db.query(Product).filter(Product.id == product_id).update(
+        {
+            Product.rating_count: Product.rating_count + 1,
+            Product.rating_sum: Product.rating_sum + rating,
+            star: star + 1,
+        },
+        synchronize_session=False,
+    )
+    db.expire(db_prod)
+    reindex_products(db, [product_id])
     db.commit()
     db.refresh(review)
+    bump_catalog_version(f"reviews:{product_id}")
+    invalidate_products(product_id)
     return ReviewResponse(
         id=review.id,
         product_id=review.product_id,
@@ -1521,18 +3542,90 @@ def create_review(
     )
 
 
+def backfill_rating_aggregates(conn, product_ids: Optional[List[int]] = None):
+    """Recompute the product rating aggregates from the reviews table in one
+    UPDATE (all products, or just `product_ids`). Works on a Connection or Session.
+    """
+    stars = func.coalesce(Review.rating, 5)
+    rated = and_(Review.product_id == Product.id, stars.between(1, 5))
+
+    def aggregate(expr, *conds):
+        return select(func.coalesce(expr, 0)).where(rated, *conds).scalar_subquery()
+
+    values = {
+        "rating_count": aggregate(func.count(Review.id)),
+        "rating_sum": aggregate(func.sum(stars)),
+    }
+    for star in range(1, 6):
+        values[f"rating_{star}"] = aggregate(func.count(Review.id), stars == star)
+    stmt = Product.__table__.update().values(**values)
+    if product_ids is not None:
+        stmt = stmt.where(Product.id.in_(product_ids))
+    conn.execute(stmt)
+
+
 # List reviews for a product
+REVIEW_SORTS = ("newest", "rating")
+REVIEWS_PAGE_SIZE = 50
+REVIEWS_PAGE_MAX = 200
+
+
+def _decode_review_cursor(after: str, sort: str) -> tuple:
+    values = decode_cursor(after, 3 if sort == "rating" else 2)
+    try:
+        created_at = datetime.fromisoformat(values[-2])
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values[-1], int) or (sort == "rating" and not isinstance(values[0], int)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return (*values[:-2], created_at, values[-1])
+
+
 @app.get("/api/products/{product_id}/reviews", response_model=List[ReviewResponse])
-def list_reviews(product_id: int, db: Session = Depends(get_db)):
-    db_prod = db.query(Product).filter(Product.id == product_id).first()
-    if not db_prod:
+def list_reviews(
+    product_id: int,
+    request: Request,
+    response: Response,
+    sort: str = Query("newest", description="newest or rating"),
+    rating: Optional[int] = Query(None, ge=1, le=5, description="Only reviews with this many stars"),
+    limit: int = Query(REVIEWS_PAGE_SIZE, ge=1, le=REVIEWS_PAGE_MAX),
+    after: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """A page of a product's reviews, newest first or highest rated first.
+    The cursor for the next page is returned in the X-Next-Cursor header and
+    can be sent back as `after`.
+    """
+    if sort not in REVIEW_SORTS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort: {sort}. Allowed: {', '.join(REVIEW_SORTS)}")
+    if not db.query(exists().where(Product.id == product_id)).scalar():
         raise HTTPException(status_code=404, detail=PRODUCT_NOT_FOUND)
-    revs = (
-        db.query(Review)
-        .filter(Review.product_id == product_id)
-        .order_by(Review.created_at.desc())
-        .all()
-    )
+    not_modified = conditional_get(request, response, catalog_version(db, f"reviews:{product_id}"))
+    if not_modified:
+        return not_modified
+
+    query = db.query(Review).filter(Review.product_id == product_id)
+    if rating is not None:
+        query = query.filter(Review.rating == rating)
+    if sort == "rating":
+        key = (Review.rating, Review.created_at, Review.id)
+    else:
+        key = (Review.created_at, Review.id)
+    if after:
+        # descending keyset: rows strictly after the cursor in (key...) order
+        values = _decode_review_cursor(after, sort)
+        conds = []
+        for i, column in enumerate(key):
+            conds.append(and_(*[key[j] == values[j] for j in range(i)], column < values[i]))
+        query = query.filter(or_(*conds))
+    revs = query.order_by(*[column.desc() for column in key]).limit(limit + 1).all()
+    if len(revs) > limit:
+        revs = revs[:limit]
+        last = revs[-1]
+        values = [last.created_at.isoformat(), last.id]
+        if sort == "rating":
+            values.insert(0, last.rating)
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(values)
     return [
         ReviewResponse(
             id=r.id,
@@ -1547,6 +3640,145 @@ def list_reviews(product_id: int, db: Session = Depends(get_db)):
 
 
 # Update product (admin)
+def _incoming_sizes(sizes) -> dict:
+    """Normalize a payload's sizes to {size: stock}; later duplicates win."""
+    out = {}
+    for s_obj in sizes or []:
+        if isinstance(s_obj, dict):
+            size_name = s_obj.get("size")
+            stock_val = int(s_obj.get("stock", 0)) if s_obj.get("stock") is not None else 0
+        else:
+            size_name = s_obj
+            # default stock when not provided
+            stock_val = 5
+        if size_name:
+            out[size_name] = int(stock_val)
+    return out
+
+
+def sync_variants(db: Session, product_id: int, variants_payload: list) -> dict:
+    """Bring a product's variants, images and sizes in line with `variants_payload`
+    by writing only the differences (caller commits):
+    - incoming variants with an `id` are updated, those without are created;
+    - existing variants missing from the payload are deleted;
+    - images are diffed by position (order is significant), sizes by size name.
+    Returns counts of the rows written.
+    """
+    # plain rows rather than entities: the bulk UPDATEs below bypass the identity map
+    existing = {
+        v.id: v
+        for v in db.query(Variant.id, Variant.color, Variant.color_code)
+        .filter(Variant.product_id == product_id)
+        .order_by(Variant.id)
+    }
+    incoming_ids = set()
+    for v in variants_payload:
+        if v.get("id"):
+            try:
+                vid = int(v["id"])
+            except Exception:
+                raise HTTPException(status_code=400, detail="invalid variant id")
+            if vid not in existing:
+                raise HTTPException(status_code=404, detail=f"Variant id {vid} not found for product")
+            incoming_ids.add(vid)
+
+    kept = [vid for vid in existing if vid in incoming_ids]
+    images, sizes = {vid: [] for vid in kept}, {vid: [] for vid in kept}
+    for chunk in _chunks(kept, CATALOG_CHUNK_SIZE):
+        for row in (
+            db.query(VariantImage.id, VariantImage.variant_id, VariantImage.image_url)
+            .filter(VariantImage.variant_id.in_(chunk))
+            .order_by(VariantImage.id)
+        ):
+            images[row.variant_id].append(row)
+        for row in (
+            db.query(VariantSize.id, VariantSize.variant_id, VariantSize.size, VariantSize.stock)
+            .filter(VariantSize.variant_id.in_(chunk))
+            .order_by(VariantSize.id)
+        ):
+            sizes[row.variant_id].append(row)
+
+    variant_updates, image_updates, size_updates = [], [], []
+    image_inserts, size_inserts = [], []
+    image_deletes, size_deletes = [], []
+    new_variants = []
+    for v in variants_payload:
+        color = v.get("color") or "Variant"
+        color_code = v.get("color_code")
+        desired_images = list(v.get("images") or [])
+        desired_sizes = _incoming_sizes(v.get("sizes"))
+        if not v.get("id"):
+            var = Variant(product_id=product_id, color=color, color_code=color_code)
+            new_variants.append((var, desired_images, desired_sizes))
+            continue
+
+        vid = int(v["id"])
+        var = existing[vid]
+        if (var.color, var.color_code) != (color, color_code):
+            variant_updates.append({"id": vid, "color": color, "color_code": color_code})
+
+        current = images[vid]
+        for position, url in enumerate(desired_images):
+            if position < len(current):
+                if current[position].image_url != url:
+                    image_updates.append({"id": current[position].id, "image_url": url})
+            else:
+                image_inserts.append({"variant_id": vid, "image_url": url})
+        image_deletes.extend(row.id for row in current[len(desired_images):])
+
+        seen = {}
+        for row in sizes[vid]:
+            if row.size in seen or row.size not in desired_sizes:
+                size_deletes.append(row.id)
+                continue
+            seen[row.size] = row
+            if row.stock != desired_sizes[row.size]:
+                size_updates.append({"id": row.id, "stock": desired_sizes[row.size]})
+        size_inserts.extend(
+            {"variant_id": vid, "size": name, "stock": stock}
+            for name, stock in desired_sizes.items()
+            if name not in seen
+        )
+
+    removed = [vid for vid in existing if vid not in incoming_ids]
+    for chunk in _chunks(removed, CATALOG_CHUNK_SIZE):
+        db.query(VariantSize).filter(VariantSize.variant_id.in_(chunk)).delete(synchronize_session=False)
+        db.query(VariantImage).filter(VariantImage.variant_id.in_(chunk)).delete(synchronize_session=False)
+        db.query(Variant).filter(Variant.id.in_(chunk)).delete(synchronize_session=False)
+    for chunk in _chunks(image_deletes, CATALOG_CHUNK_SIZE):
+        db.query(VariantImage).filter(VariantImage.id.in_(chunk)).delete(synchronize_session=False)
+    for chunk in _chunks(size_deletes, CATALOG_CHUNK_SIZE):
+        db.query(VariantSize).filter(VariantSize.id.in_(chunk)).delete(synchronize_session=False)
+
+    if new_variants:
+        db.add_all([var for var, _, _ in new_variants])
+        db.flush()
+        for var, desired_images, desired_sizes in new_variants:
+            image_inserts.extend({"variant_id": var.id, "image_url": url} for url in desired_images)
+            size_inserts.extend(
+                {"variant_id": var.id, "size": name, "stock": stock} for name, stock in desired_sizes.items()
+            )
+
+    # executemany bulk statements; updates are matched by primary key
+    if variant_updates:
+        db.execute(update(Variant), variant_updates)
+    if image_updates:
+        db.execute(update(VariantImage), image_updates)
+    if size_updates:
+        db.execute(update(VariantSize), size_updates)
+    if image_inserts:
+        db.execute(insert(VariantImage), image_inserts)
+    if size_inserts:
+        db.execute(insert(VariantSize), size_inserts)
+    return {
+        "variants_created": len(new_variants),
+        "variants_updated": len(variant_updates),
+        "variants_deleted": len(removed),
+        "images_written": len(image_inserts) + len(image_updates) + len(image_deletes),
+        "sizes_written": len(size_inserts) + len(size_updates) + len(size_deletes),
+    }
+
+
 @app.put("/api/products/{product_id}")
 def update_product(product_id: int, payload: ProductUpdate):
     db = SessionLocal()
@@ -1565,111 +3797,29 @@ def update_product(product_id: int, payload: ProductUpdate):
             # remove from update_data so we don't assign list directly below
             del update_data["colors"]
 
-        # If variants are provided, synchronize them intelligently:
-        # - If an incoming variant has an `id`, update that variant (and replace its images/sizes).
-        # - If incoming variant has no `id`, create it.
-        # - Any existing variants that are not present (by id) in the incoming payload are deleted.
-        if "variants" in update_data and update_data["variants"] is not None:
-            variants_payload = update_data.pop("variants")
-            try:
-                # load existing variants
-                existing_vars = db.query(Variant).filter(Variant.product_id == product.id).all()
-                existing_map = {v.id: v for v in existing_vars}
-
-                # incoming ids (present for variants the client wants to keep/update)
-                incoming_ids = {int(v.get("id")) for v in variants_payload if v.get("id")}
-
-                # delete any existing variants omitted by the client
-                to_delete = [vid for vid in existing_map.keys() if vid not in incoming_ids]
-                if to_delete:
-                    db.query(VariantSize).filter(VariantSize.variant_id.in_(to_delete)).delete(synchronize_session=False)
-                    db.query(VariantImage).filter(VariantImage.variant_id.in_(to_delete)).delete(synchronize_session=False)
-                    db.query(Variant).filter(Variant.id.in_(to_delete)).delete(synchronize_session=False)
-                    db.commit()
-            except Exception:
-                db.rollback()
-                raise HTTPException(status_code=500, detail="Failed to diff existing variants")
-
-            # Process incoming variants: update existing or create new ones
-            for v in variants_payload:
-                try:
-                    vid = v.get("id")
-                    color = v.get("color") or "Variant"
-                    color_code = v.get("color_code")
-
-                    if vid:
-                        # update existing variant
-                        try:
-                            vid = int(vid)
-                        except Exception:
-                            raise HTTPException(status_code=400, detail="invalid variant id")
-                        var = db.query(Variant).filter(Variant.id == vid, Variant.product_id == product.id).first()
-                        if not var:
-                            raise HTTPException(status_code=404, detail=f"Variant id {vid} not found for product")
-                        var.color = color
-                        var.color_code = color_code
-                        db.add(var)
-                        db.commit()
-
-                        # Replace images and sizes for this variant: delete existing then insert new
-                        db.query(VariantImage).filter(VariantImage.variant_id == var.id).delete(synchronize_session=False)
-                        db.query(VariantSize).filter(VariantSize.variant_id == var.id).delete(synchronize_session=False)
-                        for url in v.get("images") or []:
-                            vi = VariantImage(variant_id=var.id, image_url=url)
-                            db.add(vi)
-                        # Sizes can be provided as objects { size, stock } or simple strings.
-                        for s_obj in v.get("sizes") or []:
-                            if isinstance(s_obj, dict):
-                                size_name = s_obj.get("size")
-                                stock_val = int(s_obj.get("stock", 0)) if s_obj.get("stock") is not None else 0
-                            else:
-                                size_name = s_obj
-                                # default stock when not provided
-                                stock_val = 5
-                            if size_name:
-                                vs = VariantSize(variant_id=var.id, size=size_name, stock=int(stock_val))
-                                db.add(vs)
-                        db.commit()
-                    else:
-                        # create new variant
-                        var = Variant(product_id=product.id, color=color, color_code=color_code)
-                        db.add(var)
-                        db.commit()
-                        db.refresh(var)
-                        for url in v.get("images") or []:
-                            vi = VariantImage(variant_id=var.id, image_url=url)
-                            db.add(vi)
-                        for s_obj in v.get("sizes") or []:
-                            if isinstance(s_obj, dict):
-                                size_name = s_obj.get("size")
-                                stock_val = int(s_obj.get("stock", 0)) if s_obj.get("stock") is not None else 0
-                            else:
-                                size_name = s_obj
-                                stock_val = 5
-                            if size_name:
-                                vs = VariantSize(variant_id=var.id, size=size_name, stock=int(stock_val))
-                                db.add(vs)
-                        db.commit()
-                except HTTPException:
-                    raise
-                except Exception:
-                    db.rollback()
-                    raise HTTPException(status_code=500, detail="Failed to process variants payload")
+        # Variants, product fields and the product document are written in one
+        # transaction: a failed update leaves the product untouched.
+        variants_payload = update_data.pop("variants", None)
+        if variants_payload is not None:
+            sync_variants(db, product.id, variants_payload)
 
         for key, value in update_data.items():
             setattr(product, key, value)
 
         db.add(product)
+        db.flush()
+        reindex_products(db, [product.id])
         db.commit()
-        db.refresh(product)
-        return {"id": product.id, "message": "Product updated successfully"}
     except HTTPException:
+        db.rollback()
         raise
     except Exception:
         db.rollback()
         raise HTTPException(status_code=400, detail="Failed to update product")
     finally:
         db.close()
+    invalidate_products(product_id)
+    return {"id": product_id, "message": "Product updated successfully"}
 
 
 # Delete product (admin)
@@ -1693,13 +3843,17 @@ def delete_product(product_id: int):
                 db.query(Variant).filter(Variant.id.in_(vard_ids)).delete(synchronize_session=False)
             # delete reviews referencing this product
             db.query(Review).filter(Review.product_id == product.id).delete(synchronize_session=False)
-            # finally delete product
+            db.query(ProductDocument).filter(ProductDocument.product_id == product.id).delete(synchronize_session=False)
+            # finally delete product, then drop its search entry
             db.delete(product)
+            db.flush()
+            sync_product_search(db, [product_id])
             db.commit()
         except Exception:
             db.rollback()
             raise HTTPException(status_code=500, detail="Failed to delete product and linked data")
 
+        invalidate_products(product_id)
         return {"id": product_id, "message": "Product and linked records deleted"}
     finally:
         db.close()
@@ -1707,14 +3861,25 @@ def delete_product(product_id: int):
 
 # Services
 @app.get("/api/services", response_model=List[dict])
-def get_services(category: Optional[str] = None):
+def get_services(request: Request, response: Response, category: Optional[str] = None):
     db = SessionLocal()
     try:
+        version = catalog_version(db, "services")
+        not_modified = conditional_get(request, response, version)
+        if not_modified:
+            return not_modified
+
+        cache_key = ("services", version, category)
+        cached = catalog_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        generation = catalog_cache.generation
         query = db.query(Service)
         if category:
             query = query.filter(Service.category == category)
         services = query.all()
-        return [
+        payload = [
             {
                 "id": s.id,
                 "name": s.name,
@@ -1725,6 +3890,8 @@ def get_services(category: Optional[str] = None):
             }
             for s in services
         ]
+        catalog_cache.set(cache_key, payload, ("services",), generation)
+        return payload
     finally:
         db.close()
 
@@ -1804,6 +3971,522 @@ def create_inquiry(inquiry: InquiryCreate):
         db.close()
 
 
+# Order field selection: `?fields=` limits the keys of each order and
+# `?include=shipment` attaches the latest shipment.
+ORDER_FIELDS = (
+    "id",
+    "customer_name",
+    "email",
+    "phone",
+    "address",
+    "total_amount",
+    "items",
+    "created_at",
+    "shipment",
+)
+_ORDER_COLUMNS = {
+    "customer_name": Order.customer_name,
+    "email": Order.email,
+    "phone": Order.phone,
+    "address": Order.address,
+    "total_amount": Order.total_amount,
+    "items": Order.items,
+    "created_at": Order.created_at,
+}
+
+
+def order_view(
+    fields: Optional[str] = Query(None, description="Comma-separated order fields to return"),
+    include: Optional[str] = Query(None, description="Relations to load: shipment"),
+) -> dict:
+    """Dependency resolving ?fields= / ?include= into an order view:
+    {"fields": set of keys or None for all, "shipment": bool or None when unspecified}.
+    """
+    selected = _parse_fieldset(fields, ORDER_FIELDS, "fields")
+    included = _parse_fieldset(include, ("shipment",), "include")
+    if selected is not None:
+        selected.add("id")
+    shipment = None
+    if included is not None:
+        shipment = "shipment" in included
+    if selected is not None:
+        shipment = bool(shipment) or "shipment" in selected
+    return {"fields": selected, "shipment": shipment}
+
+
+def order_columns(view: dict) -> list:
+    """Order columns needed to serialize `view`, for use with load_only()."""
+    return [Order.id] + [col for key, col in _ORDER_COLUMNS.items() if _wants(view, key)]
+
+
+def serialize_shipment(shipment: Optional[Shipment]) -> Optional[dict]:
+    if shipment is None:
+        return None
+    return {
+        "id": shipment.id,
+        "courier_name": shipment.courier_name,
+        "tracking_number": shipment.tracking_number,
+        "shipped_at": shipment.shipped_at.isoformat() if shipment.shipped_at else None,
+    }
+
+
+def load_latest_shipments(db: Session, order_ids: list) -> dict:
+    """Map order id -> latest Shipment for the given orders, one query per chunk."""
+    latest = {}
+    for chunk in _chunks(list(order_ids), CATALOG_CHUNK_SIZE):
+        ranked = (
+            select(
+                Shipment.id,
+                func.row_number()
+                .over(partition_by=Shipment.order_id, order_by=(Shipment.shipped_at.desc(), Shipment.id.desc()))
+                .label("position"),
+            )
+            .where(Shipment.order_id.in_(chunk))
+            .subquery()
+        )
+        for shipment in (
+            db.query(Shipment).join(ranked, ranked.c.id == Shipment.id).filter(ranked.c.position == 1)
+        ):
+            latest[shipment.order_id] = shipment
+    return latest
+
+
+def serialize_orders(db: Session, orders: list, view: dict, shipment: bool = True) -> list:
+    """Serialize orders for the list endpoints. `shipment` is the endpoint's
+    default when the request did not choose via ?fields= / ?include=.
+    """
+    if view["shipment"] is not None:
+        shipment = view["shipment"]
+    shipments = load_latest_shipments(db, [o.id for o in orders]) if shipment else {}
+    result = []
+    for o in orders:
+        out = {}
+        for key in ORDER_FIELDS:
+            if key == "shipment":
+                if shipment:
+                    out["shipment"] = serialize_shipment(shipments.get(o.id))
+            elif not _wants(view, key):
+                continue
+            elif key == "created_at":
+                out["created_at"] = o.created_at.isoformat() if o.created_at else None
+            else:
+                out[key] = getattr(o, key)
+        result.append(out)
+    return result
+
+
+# Order listing: newest first, paged by a (created_at, id) keyset cursor.
+ORDERS_PAGE_SIZE = 50
+ORDERS_PAGE_MAX = 200
+
+
+def order_filters(
+    created_from: Optional[datetime] = Query(None, description="Orders placed at or after this time"),
+    created_to: Optional[datetime] = Query(None, description="Orders placed before this time"),
+    shipped: Optional[bool] = Query(None, description="Only shipped (true) or unshipped (false) orders"),
+    email: Optional[str] = None,
+    min_amount: Optional[float] = Query(None, ge=0),
+) -> list:
+    """Dependency turning the admin order filters into SQL conditions."""
+    conditions = []
+    if created_from is not None:
+        conditions.append(Order.created_at >= created_from)
+    if created_to is not None:
+        conditions.append(Order.created_at < created_to)
+    if shipped is not None:
+        has_shipment = exists().where(Shipment.order_id == Order.id)
+        conditions.append(has_shipment if shipped else ~has_shipment)
+    if email:
+        conditions.append(Order.email == email.strip())
+    if min_amount is not None:
+        conditions.append(Order.total_amount >= min_amount)
+    return conditions
+
+
+def _decode_order_cursor(after: str) -> tuple:
+    created_at, order_id = decode_cursor(after, 2)
+    try:
+        created_at = datetime.fromisoformat(created_at)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(order_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, order_id
+
+
+def load_orders_page(
+    db: Session,
+    conditions: list,
+    view: dict,
+    response: Response,
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    shipment: bool = True,
+) -> list:
+    """Serialized orders matching `conditions`, newest first. With a `limit` the
+    next page's cursor is set in the X-Next-Cursor header of `response`.
+    """
+    query = db.query(Order).options(load_only(*order_columns(view))).filter(*conditions)
+    if after:
+        created_at, order_id = _decode_order_cursor(after)
+        query = query.filter(
+            or_(Order.created_at < created_at, and_(Order.created_at == created_at, Order.id < order_id))
+        )
+    query = query.order_by(Order.created_at.desc(), Order.id.desc())
+    if limit is None:
+        orders = query.all()
+    else:
+        orders = query.limit(limit + 1).all()
+        if len(orders) > limit:
+            orders = orders[:limit]
+            last = orders[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor([last.created_at.isoformat(), last.id])
+    return serialize_orders(db, orders, view, shipment=shipment)
+
+
+# Order lines: the items of every order are also stored as `order_items` rows so
+# sales can be aggregated in SQL instead of parsing `Order.items` JSON.
+ORDER_ITEMS_BACKFILL_CHUNK = 500
+
+
+def parse_order_items(raw) -> list:
+    """Cart items from an `Order.items` value (a JSON array, sometimes encoded twice)."""
+    items = raw
+    for _ in range(2):
+        if not isinstance(items, str):
+            break
+        try:
+            items = json.loads(items)
+        except Exception:
+            return []
+    return [it for it in items if isinstance(it, dict)] if isinstance(items, list) else []
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def order_item_rows(order_id: int, items: list) -> list:
+    """`order_items` rows for the cart items of one order."""
+    rows = []
+    for it in items:
+        if not isinstance(it, dict):
+            continue
+        try:
+            unit_price = float(it["price"]) if it.get("price") is not None else None
+        except (TypeError, ValueError):
+            unit_price = None
+        size = it.get("size") or it.get("selectedSize")
+        rows.append(
+            {
+                "order_id": order_id,
+                "product_id": _int_or_none(it.get("product_id") or it.get("id")),
+                "variant_id": _int_or_none(it.get("variant_id")),
+                "size": str(size) if size else None,
+                "quantity": max(_int_or_none(it.get("quantity")) or 1, 1),
+                "unit_price": unit_price,
+            }
+        )
+    return rows
+
+
+def add_order_items(db: Session, order_id: int, items: list) -> int:
+    """Insert the order lines of `order_id` (caller commits)."""
+    rows = order_item_rows(order_id, items)
+    if rows:
+        db.execute(insert(OrderItem), rows)
+    return len(rows)
+
+
+def backfill_order_items_chunk(db: Session, after_id: int, limit: int) -> tuple:
+    """Write order lines for the next `limit` orders after `after_id` that have
+    none (caller commits). Returns (last order id seen or None when done, lines written).
+    """
+    orders = db.execute(
+        select(Order.id, Order.items)
+        .where(Order.id > after_id, ~exists().where(OrderItem.order_id == Order.id))
+        .order_by(Order.id)
+        .limit(limit)
+    ).all()
+    if not orders:
+        return None, 0
+    rows = [row for order_id, raw in orders for row in order_item_rows(order_id, parse_order_items(raw))]
+    if rows:
+        db.execute(insert(OrderItem), rows)
+    return orders[-1][0], len(rows)
+
+
+# Cart pricing: orders are charged catalog prices plus shipping below the
+# free-shipping threshold, whatever total the client computed.
+SHIPPING_FEE = float(os.getenv("SHIPPING_FEE", "100"))
+FREE_SHIPPING_ABOVE = float(os.getenv("FREE_SHIPPING_ABOVE", "1000"))
+
+
+def order_total(subtotal: float) -> float:
+    shipping = 0.0 if subtotal > FREE_SHIPPING_ABOVE else SHIPPING_FEE
+    return round(subtotal + shipping, 2)
+
+
+def resolve_cart(db: Session, items: list) -> tuple:
+    """Check cart items against the catalog with one query: each item gets the
+    current catalog `price` and a `selectedColor` ({name, hex}; from its variant
+    unless the client sent one). Returns (items, total including shipping).
+    Raises 400 for an empty cart or a bad quantity and 409 when a product or
+    variant does not exist.
+    """
+    items = [it if isinstance(it, dict) else {"id": it} for it in items or []]
+    if not items:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    product_ids = {_int_or_none(it.get("product_id") or it.get("id")) for it in items} - {None}
+    variant_ids = {_int_or_none(it.get("variant_id")) for it in items} - {None}
+    prices, variants = {}, {}
+    if product_ids:
+        for product_id, price, variant_id, color, color_code in db.execute(
+            select(Product.id, Product.price, Variant.id, Variant.color, Variant.color_code)
+            .outerjoin(Variant, and_(Variant.product_id == Product.id, Variant.id.in_(sorted(variant_ids))))
+            .where(Product.id.in_(sorted(product_ids)))
+        ):
+            prices[product_id] = price or 0.0
+            if variant_id is not None:
+                variants[variant_id] = (product_id, {"name": color, "hex": color_code})
+
+    subtotal, unknown = 0.0, []
+    for it in items:
+        product_id = _int_or_none(it.get("product_id") or it.get("id"))
+        variant_id = _int_or_none(it.get("variant_id"))
+        quantity = 1 if it.get("quantity") is None else _int_or_none(it.get("quantity"))
+        if quantity is None or quantity < 1:
+            raise HTTPException(status_code=400, detail="quantity must be at least 1")
+        if product_id not in prices:
+            unknown.append({"product_id": product_id, "error": "unknown product"})
+            continue
+        if it.get("variant_id") and variants.get(variant_id, (None,))[0] != product_id:
+            unknown.append({"product_id": product_id, "variant_id": it.get("variant_id"), "error": "unknown variant"})
+            continue
+        it["price"] = prices[product_id]
+        if not it.get("selectedColor"):
+            if variant_id:
+                it["selectedColor"] = variants[variant_id][1]
+            elif it.get("variant_color"):
+                it["selectedColor"] = {"name": it["variant_color"], "hex": None}
+            else:
+                it["selectedColor"] = None
+        subtotal += prices[product_id] * quantity
+    if unknown:
+        raise HTTPException(status_code=409, detail={"error": "unknown_items", "items": unknown})
+    return items, order_total(subtotal)
+
+
+# Stock reservations
+# Checkout takes stock with one conditional UPDATE per size
+# (`SET stock = stock - :qty WHERE id = :id AND stock >= :qty`) inside the order's
+# own transaction, so concurrent checkouts of the same size only queue on that row
+# and stock can never go negative. A UPI QR holds its stock until the payment is
+# captured, the QR is closed, or the reservation expires.
+STOCK_RESERVATION_TTL = int(os.getenv("STOCK_RESERVATION_TTL", "900"))
+
+
+def _stock_requests(db: Session, items: list) -> tuple:
+    """Resolve cart items to ({variant_size_id: quantity}, {variant_size_id: (variant_id, size, product_id)},
+    unknown items). Items without a variant_id and size are not stock-tracked.
+    """
+    wanted = {}
+    for it in items or []:
+        if not isinstance(it, dict):
+            continue
+        variant_id, size = it.get("variant_id"), it.get("size") or it.get("selectedSize")
+        if not variant_id or not size:
+            continue
+        try:
+            key, quantity = (int(variant_id), str(size)), int(it.get("quantity") or 1)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="invalid variant_id or quantity")
+        if quantity < 1:
+            raise HTTPException(status_code=400, detail="quantity must be at least 1")
+        wanted[key] = wanted.get(key, 0) + quantity
+    if not wanted:
+        return {}, {}, []
+
+    found = {}
+    for chunk in _chunks(sorted({variant_id for variant_id, _ in wanted}), CATALOG_CHUNK_SIZE):
+        for size_id, variant_id, size, product_id in (
+            db.query(VariantSize.id, VariantSize.variant_id, VariantSize.size, Variant.product_id)
+            .join(Variant, Variant.id == VariantSize.variant_id)
+            .filter(VariantSize.variant_id.in_(chunk))
+            .order_by(VariantSize.id)
+        ):
+            found.setdefault((variant_id, size), (size_id, product_id))
+    quantities, skus, unknown = {}, {}, []
+    for (variant_id, size), quantity in wanted.items():
+        if (variant_id, size) not in found:
+            unknown.append({"variant_id": variant_id, "size": size, "error": "unknown variant/size"})
+            continue
+        size_id, product_id = found[(variant_id, size)]
+        quantities[size_id] = quantity
+        skus[size_id] = (variant_id, size, product_id)
+    return quantities, skus, unknown
+
+
+def _take_stock(db: Session, size_id: int, quantity: int) -> bool:
+    """Decrement one size's stock if at least `quantity` is left."""
+    return bool(
+        db.execute(
+            update(VariantSize)
+            .where(VariantSize.id == size_id, VariantSize.stock >= quantity)
+            .values(stock=VariantSize.stock - quantity)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    )
+
+
+def reserve_stock(
+    db: Session,
+    items: list,
+    status: str = "held",
+    payment_id: Optional[int] = None,
+    order_id: Optional[int] = None,
+    expires_at: Optional[datetime] = None,
+) -> List[int]:
+    """Take the stock for the cart `items` and record the reservations (caller commits).
+    Rolls the session back and raises 409 when any size is unknown or short.
+    Returns the ids of the affected products.
+    """
+    quantities, skus, failed = _stock_requests(db, items)
+    if not failed:
+        # fixed lock order (ascending size id) so two checkouts never deadlock
+        for size_id in sorted(quantities):
+            if not _take_stock(db, size_id, quantities[size_id]):
+                variant_id, size, _ = skus[size_id]
+                failed.append(
+                    {"variant_id": variant_id, "size": size, "quantity": quantities[size_id], "error": "out of stock"}
+                )
+    if failed:
+        db.rollback()
+        raise HTTPException(status_code=409, detail={"error": "out_of_stock", "items": failed})
+    if quantities:
+        db.execute(
+            insert(StockReservation),
+            [
+                {
+                    "variant_size_id": size_id,
+                    "quantity": quantity,
+                    "payment_id": payment_id,
+                    "order_id": order_id,
+                    "status": status,
+                    "expires_at": expires_at,
+                }
+                for size_id, quantity in sorted(quantities.items())
+            ],
+        )
+    return sorted({product_id for _, _, product_id in skus.values()})
+
+
+def _size_product_ids(db: Session, size_ids) -> List[int]:
+    if not size_ids:
+        return []
+    return sorted(
+        db.execute(
+            select(Variant.product_id)
+            .join(VariantSize, VariantSize.variant_id == Variant.id)
+            .where(VariantSize.id.in_(sorted(size_ids)))
+            .distinct()
+        ).scalars()
+    )
+
+
+def release_reservations(db: Session, *criteria) -> List[int]:
+    """Release the held reservations matching `criteria` and return their stock
+    (caller commits). Claiming the rows and flipping their status is one conditional
+    UPDATE, so a reservation is never released twice. Returns the affected product ids.
+    """
+    claimed = db.execute(
+        update(StockReservation)
+        .where(StockReservation.status == "held", *criteria)
+        .values(status="released")
+        .returning(StockReservation.variant_size_id, StockReservation.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+    restock = {}
+    for size_id, quantity in claimed:
+        restock[size_id] = restock.get(size_id, 0) + quantity
+    for size_id in sorted(restock):
+        db.execute(
+            update(VariantSize)
+            .where(VariantSize.id == size_id)
+            .values(stock=VariantSize.stock + restock[size_id])
+            .execution_options(synchronize_session=False)
+        )
+    return _size_product_ids(db, restock)
+
+
+def release_expired_reservations(db: Session) -> List[int]:
+    """Return the stock of expired, unpaid reservations and commit."""
+    product_ids = release_reservations(db, StockReservation.expires_at < datetime.utcnow())
+    db.commit()
+    if product_ids:
+        refresh_product_documents(db, product_ids)
+    return product_ids
+
+
+def commit_payment_reservations(db: Session, payment_id: int, order_id: int) -> tuple:
+    """Attach a captured payment's reservations to its order (caller commits).
+    Reservations that expired before the capture are taken again when the stock
+    allows. Returns (ids of products whose stock changed, reservations that could
+    not be taken again as {variant_size_id, quantity}).
+    """
+    db.execute(
+        update(StockReservation)
+        .where(StockReservation.payment_id == payment_id, StockReservation.status == "held")
+        .values(status="committed", order_id=order_id)
+        .execution_options(synchronize_session=False)
+    )
+    short = []
+    lapsed = (
+        db.query(StockReservation)
+        .filter(StockReservation.payment_id == payment_id, StockReservation.status == "released")
+        .order_by(StockReservation.variant_size_id)
+        .all()
+    )
+    for reservation in lapsed:
+        if _take_stock(db, reservation.variant_size_id, reservation.quantity):
+            reservation.status = "committed"
+            reservation.order_id = order_id
+        else:
+            short.append({"variant_size_id": reservation.variant_size_id, "quantity": reservation.quantity})
+    taken = {r.variant_size_id for r in lapsed if r.status == "committed"}
+    return _size_product_ids(db, taken), short
+
+
+def refresh_product_documents(db: Session, product_ids: List[int]):
+    """Best-effort reindex of products after a committed stock change. Runs in its
+    own short transaction so checkouts do not hold document rows while they commit.
+    """
+    if not product_ids:
+        return
+    try:
+        reindex_products(db, product_ids)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.warning(f"Failed to refresh documents of products {product_ids}")
+    invalidate_stock(*product_ids)
+
+
+def notify_short_stock(db: Session, order_id: int, short: list):
+    """Tell admins that a paid order could not get all of its stock back."""
+    if short:
+        create_admin_notification(
+            db,
+            n_type="stock",
+            ref_id=order_id,
+            title=f"Order {order_id} was paid after its stock reservation expired",
+            body=f"Could not reserve again: {json.dumps(short)}",
+        )
+
+
 # Orders
 @app.post("/api/orders")
 def create_order(
@@ -1811,50 +4494,92 @@ def create_order(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    """Create an order tied to the authenticated user."""
+    """Create an order tied to the authenticated user, priced from the catalog.
+    Stock is taken in the same transaction; with `payment_id` the order takes
+    over that paid QR's reservation, with the items and total fixed when the QR
+    was created.
+    """
     try:
         order_data = order.dict()
+        payment_id = order_data.pop("payment_id", None)
         # Enforce allowed payment methods: only UPI is permitted via API
-        pm = order_data.get('payment_method') if isinstance(order_data, dict) else None
+        pm = order_data.pop('payment_method', None)
         if pm and pm.lower() not in ('upi',):
             raise HTTPException(status_code=400, detail="Only UPI payments are accepted at this time")
+        payment = None
+        if payment_id is not None:
+            payment = (
+                db.query(Payment)
+                .filter(Payment.id == int(payment_id), Payment.user_id == current_user.id)
+                .with_for_update()
+                .first()
+            )
+            if not payment:
+                raise HTTPException(status_code=404, detail="Payment not found")
+            if payment.order_id:
+                # the webhook already placed this order
+                existing = db.query(Order).filter(Order.id == payment.order_id).first()
+                return {
+                    "id": payment.order_id,
+                    "message": "Order placed successfully",
+                    "created_at": (
+                        existing.created_at.isoformat() if existing and existing.created_at else None
+                    ),
+                }
+            if payment.status != "paid":
+                raise HTTPException(status_code=409, detail="Payment has not been received yet")
+        else:
+            release_expired_reservations(db)
         # Override email/customer_name with authenticated user info for integrity
         order_data["email"] = current_user.email
         order_data["customer_name"] = current_user.name
-    # Normalize items: ensure we store `selectedColor` { name, hex } for every item
+        order_data["user_id"] = current_user.id
+        # Normalize items: catalog prices and a `selectedColor` { name, hex } for every item
         try:
             raw_items = order_data.get('items', '[]')
             items = json.loads(raw_items) if isinstance(raw_items, str) else raw_items
         except Exception:
             items = []
-        normalized = []
-        for it in items:
-            # If frontend already provided selectedColor, keep it
-            sc = it.get('selectedColor') if isinstance(it, dict) else None
-            if not sc:
-                # Try to derive from variant_id if present
-                vid = it.get('variant_id') if isinstance(it, dict) else None
-                if vid:
-                    try:
-                        v = db.query(Variant).filter(Variant.id == int(vid)).first()
-                        if v:
-                            sc = {'name': v.color, 'hex': v.color_code}
-                    except Exception:
-                        sc = None
-                # Fallback to variant_color string
-                if not sc and isinstance(it, dict) and it.get('variant_color'):
-                    sc = {'name': it.get('variant_color'), 'hex': None}
-            # Ensure item is a dict and attach selectedColor field
-            if not isinstance(it, dict):
-                it = {'id': it}
-            it['selectedColor'] = sc
-            normalized.append(it)
+        paid_items, bare_payment = None, False
+        if payment is not None:
+            try:
+                paid_items = json.loads(payment.metadata_json or "{}").get("items")
+            except Exception:
+                paid_items = None
+        if paid_items and isinstance(paid_items, list):
+            # the QR priced and reserved these items; the order is what was paid for,
+            # even if catalog prices changed while the customer was paying
+            normalized, total = paid_items, payment.amount / 100.0
+        else:
+            normalized, total = resolve_cart(db, items if isinstance(items, list) else [])
+            # a QR for a bare amount held no stock: it must cover the cart at catalog
+            # prices, and the stock is taken now like a direct order's
+            bare_payment = payment is not None
+            if bare_payment and payment.amount < round(total * 100):
+                raise HTTPException(status_code=409, detail="Payment does not cover the order total")
         # store back normalized items as JSON string
         order_data['items'] = json.dumps(normalized)
+        order_data['total_amount'] = total
         db_order = Order(**order_data)
         db.add(db_order)
+        db.flush()
+        add_order_items(db, db_order.id, normalized)
+        short, product_ids = [], []
+        if bare_payment:
+            product_ids = reserve_stock(
+                db, normalized, status="committed", payment_id=payment.id, order_id=db_order.id
+            )
+        elif payment is not None:
+            product_ids, short = commit_payment_reservations(db, payment.id, db_order.id)
+        else:
+            product_ids = reserve_stock(db, normalized, status="committed", order_id=db_order.id)
+        if payment is not None:
+            payment.order_id = db_order.id
+            db.add(payment)
         db.commit()
+        refresh_product_documents(db, product_ids)
         db.refresh(db_order)
+        notify_short_stock(db, db_order.id, short)
         # Clear the user's persisted cart now that the order is placed
         try:
             cart = db.query(Cart).filter(Cart.user_id == current_user.id).first()
@@ -1900,53 +4625,18 @@ def create_order(
 
 @app.get("/api/orders/user", response_model=List[dict])
 def get_user_orders(
-    current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(ORDERS_PAGE_SIZE, ge=1, le=ORDERS_PAGE_MAX),
+    after: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    view: dict = Depends(order_view),
 ):
-    """Return orders for the authenticated user."""
-    try:
-        orders = (
-            db.query(Order)
-            .filter(Order.email == current_user.email)
-            .order_by(Order.created_at.desc())
-            .all()
-        )
-        result = []
-        for o in orders:
-            # Attach latest shipment (if any)
-            shipment = (
-                db.query(Shipment)
-                .filter(Shipment.order_id == o.id)
-                .order_by(Shipment.shipped_at.desc())
-                .first()
-            )
-            shipment_data = None
-            if shipment:
-                shipment_data = {
-                    "id": shipment.id,
-                    "courier_name": shipment.courier_name,
-                    "tracking_number": shipment.tracking_number,
-                    "shipped_at": (
-                        shipment.shipped_at.isoformat() if shipment.shipped_at else None
-                    ),
-                }
-
-            result.append(
-                {
-                    "id": o.id,
-                    "customer_name": o.customer_name,
-                    "email": o.email,
-                    "phone": o.phone,
-                    "address": o.address,
-                    "total_amount": o.total_amount,
-                    "items": o.items,
-                    "created_at": o.created_at.isoformat() if o.created_at else None,
-                    "shipment": shipment_data,
-                }
-            )
-        return result
-    finally:
-        # db is managed by dependency - don't close here explicitly
-        pass
+    """Return a page of the authenticated user's orders, newest first. The cursor
+    for the next page is returned in the X-Next-Cursor header and can be sent back as `after`.
+    """
+    orders = load_orders_page(db, [Order.user_id == current_user.id], view, response, limit=limit, after=after)
+    return json_response(orders, response)
 
 
 # Wishlist endpoints (per-user wishlist)
@@ -2035,65 +4725,71 @@ def remove_from_wishlist(product_id: int, current_user: User = Depends(get_curre
 
 # Development helper: list all orders (no auth) for debugging only
 @app.get("/api/orders/all", response_model=List[dict])
-def get_all_orders(db: Session = Depends(get_db)):
+def get_all_orders(response: Response, db: Session = Depends(get_db), view: dict = Depends(order_view)):
     """Return all orders (development helper)."""
-    orders = db.query(Order).order_by(Order.created_at.desc()).all()
-    result = []
-    for o in orders:
-        result.append(
-            {
-                "id": o.id,
-                "customer_name": o.customer_name,
-                "email": o.email,
-                "phone": o.phone,
-                "address": o.address,
-                "total_amount": o.total_amount,
-                "items": o.items,
-                "created_at": o.created_at.isoformat() if o.created_at else None,
-            }
-        )
-    return result
+    return json_response(load_orders_page(db, [], view, response, shipment=False), response)
 
 
 # Admin: list all orders with details
 @app.get("/api/admin/orders", response_model=List[dict])
 def admin_list_orders(
-    admin_user: User = Depends(get_current_admin), db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(ORDERS_PAGE_SIZE, ge=1, le=ORDERS_PAGE_MAX),
+    after: Optional[str] = None,
+    conditions: list = Depends(order_filters),
+    admin_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db),
+    view: dict = Depends(order_view),
 ):
-    orders = db.query(Order).order_by(Order.created_at.desc()).all()
-    result = []
-    for o in orders:
-        shipment = (
-            db.query(Shipment)
-            .filter(Shipment.order_id == o.id)
-            .order_by(Shipment.shipped_at.desc())
-            .first()
-        )
-        shipment_data = None
-        if shipment:
-            shipment_data = {
-                "id": shipment.id,
-                "courier_name": shipment.courier_name,
-                "tracking_number": shipment.tracking_number,
-                "shipped_at": (
-                    shipment.shipped_at.isoformat() if shipment.shipped_at else None
-                ),
-            }
+    """A page of orders, newest first, with their latest shipment. Filter by
+    created_from / created_to, shipped, email and min_amount; the cursor for the
+    next page is returned in the X-Next-Cursor header and can be sent back as `after`.
+    """
+    orders = load_orders_page(db, conditions, view, response, limit=limit, after=after)
+    return json_response(orders, response)
 
-        result.append(
-            {
-                "id": o.id,
-                "customer_name": o.customer_name,
-                "email": o.email,
-                "phone": o.phone,
-                "address": o.address,
-                "total_amount": o.total_amount,
-                "items": o.items,
-                "created_at": o.created_at.isoformat() if o.created_at else None,
-                "shipment": shipment_data,
-            }
+
+# Sales report: units and revenue per product or per variant size, aggregated in
+# SQL over `order_items` for orders placed in [created_from, created_to).
+SALES_GROUPS = {
+    "product": (OrderItem.product_id,),
+    "variant": (OrderItem.product_id, OrderItem.variant_id, OrderItem.size),
+}
+
+
+@app.get("/api/admin/reports/sales", response_model=List[dict])
+def admin_sales_report(
+    created_from: Optional[datetime] = Query(None, description="Orders placed at or after this time"),
+    created_to: Optional[datetime] = Query(None, description="Orders placed before this time"),
+    group_by: str = Query("product", description="product or variant"),
+    limit: int = Query(100, ge=1, le=1000),
+    admin_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db),
+):
+    """Best sellers first: units sold, revenue and number of orders per group."""
+    if group_by not in SALES_GROUPS:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by: {group_by}. Allowed: {', '.join(SALES_GROUPS)}")
+    keys = SALES_GROUPS[group_by]
+    units = func.sum(OrderItem.quantity).label("units")
+    query = (
+        select(
+            *keys,
+            units,
+            func.sum(OrderItem.quantity * func.coalesce(OrderItem.unit_price, 0)).label("revenue"),
+            func.count(func.distinct(OrderItem.order_id)).label("orders"),
         )
-    return result
+        .join(Order, Order.id == OrderItem.order_id)
+        .group_by(*keys)
+        .order_by(units.desc(), *keys)
+        .limit(limit)
+    )
+    if created_from is not None:
+        query = query.where(Order.created_at >= created_from)
+    if created_to is not None:
+        query = query.where(Order.created_at < created_to)
+    return json_response([
+        {**row._asdict(), "revenue": round(row.revenue or 0, 2)} for row in db.execute(query)
+    ])
 
 
 # Admin notifications: list and acknowledge
@@ -2124,7 +4820,7 @@ def admin_list_notifications(
                 "acknowledged_at": n.acknowledged_at.isoformat() if n.acknowledged_at else None,
             }
         )
-    return out
+    return json_response(out)
 
 
 @app.post("/api/admin/notifications/{notif_id}/ack")
@@ -2251,6 +4947,8 @@ def create_razorpay_qr(
 ):
     """Create a Razorpay UPI QR for the requested amount and return image_url and payment id.
     Payload: { amount: 350.0, currency: 'INR', metadata: {...} }
+    The stock of `metadata.items` is held until the payment is captured or the QR
+    expires (STOCK_RESERVATION_TTL seconds); 409 when an item is out of stock.
     """
     key_id = os.getenv("RAZORPAY_KEY_ID")
     key_secret = os.getenv("RAZORPAY_KEY_SECRET")
@@ -2261,7 +4959,19 @@ def create_razorpay_qr(
         if not allow_local_qr:
             raise HTTPException(status_code=500, detail="Razorpay API keys not configured. Set RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET, or set ALLOW_LOCAL_RAZORPAY_QR=1 for a local dev QR fallback.")
 
+    metadata = payload.get("metadata") or {}
+    items = metadata.get("items") if isinstance(metadata, dict) else None
+    if isinstance(items, str):
+        try:
+            items = json.loads(items)
+        except Exception:
+            items = []
+
     amount_rupees = payload.get("amount")
+    if items and isinstance(items, list):
+        # charge the catalog total for the cart, not the client's figure
+        items, amount_rupees = resolve_cart(db, items)
+        metadata["items"] = items
     if amount_rupees is None:
         raise HTTPException(status_code=400, detail="amount is required")
 
@@ -2271,17 +4981,22 @@ def create_razorpay_qr(
     except Exception:
         raise HTTPException(status_code=400, detail="invalid amount")
 
+    release_expired_reservations(db)
     payment = Payment(
         user_id=current_user.id if current_user else None,
         amount=amount_paise,
         currency=payload.get("currency", "INR"),
         provider="razorpay",
         status="pending",
-        metadata_json=json.dumps(payload.get("metadata", {})),
+        metadata_json=json.dumps(metadata),
     )
     db.add(payment)
+    db.flush()
+    expires_at = datetime.utcnow() + timedelta(seconds=STOCK_RESERVATION_TTL)
+    product_ids = reserve_stock(db, items or [], payment_id=payment.id, expires_at=expires_at)
     db.commit()
     db.refresh(payment)
+    refresh_product_documents(db, product_ids)
 
     image_url = None
     provider_qr_id = None
@@ -2297,6 +5012,8 @@ def create_razorpay_qr(
             "payment_amount": amount_paise,
             "description": "Vruksha order payment",
             "notes": {"local_payment_id": str(payment.id)},
+            # the QR stops accepting payments when its stock reservation expires
+            "close_by": calendar.timegm(expires_at.utctimetuple()),
         }
         try:
             resp = requests.post(
@@ -2322,13 +5039,18 @@ def create_razorpay_qr(
                     pdata = {"raw": resp.text}
                 raise HTTPException(status_code=502, detail={"provider_status": resp.status_code, "provider_error": pdata})
         except Exception as e:
-            # network or other error when calling provider
+            # network or other error when calling provider: give the held stock back
+            db.rollback()
+            product_ids = release_reservations(db, StockReservation.payment_id == payment.id)
+            db.commit()
+            refresh_product_documents(db, product_ids)
             raise HTTPException(status_code=502, detail={"error": "provider_request_failed", "message": str(e)})
 
     return {
         "payment_id": payment.id,
         "provider_order_id": provider_qr_id,
         "image_url": image_url,
+        "amount": amount_paise / 100.0,
     }
 
     # If we reached here and keys were absent but local QR fallback is enabled,
@@ -2369,6 +5091,7 @@ def close_razorpay_qr(
     """Close a previously-created Razorpay QR by local payment id.
     Payload: { payment_id: <int> }
     This will call Razorpay's close endpoint for the provider_order_id (qr id) and mark local payment as 'closed' (or 'expired').
+    Stock still held for the payment is released.
     """
     pid = payload.get("payment_id")
     if not pid:
@@ -2378,6 +5101,11 @@ def close_razorpay_qr(
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
 
+    if payment.status != "paid":
+        product_ids = release_reservations(db, StockReservation.payment_id == payment.id)
+        db.commit()
+        refresh_product_documents(db, product_ids)
+
     provider_qr_id = payment.provider_order_id
     key_id = os.getenv("RAZORPAY_KEY_ID")
     key_secret = os.getenv("RAZORPAY_KEY_SECRET")
@@ -2488,12 +5216,13 @@ async def razorpay_webhook(request: Request, db: Session = Depends(get_db)):
 
     # On capture/authorized mark as paid and create order
     if event in ("payment.captured", "payment.authorized"):
+        # lock the payment so a concurrent create_order with this payment_id waits
+        payment = db.query(Payment).filter(Payment.id == payment.id).with_for_update().populate_existing().first()
         if payment.status != "paid":
             payment.status = "paid"
             payment.provider_payment_id = provider_payment_id
             payment.updated_at = datetime.utcnow()
             db.add(payment)
-            db.commit()
 
             # create Order from metadata
             try:
@@ -2501,51 +5230,133 @@ async def razorpay_webhook(request: Request, db: Session = Depends(get_db)):
             except Exception:
                 meta = {}
             order_items = meta.get("items") or "[]"
+            payer = db.query(User).filter(User.id == payment.user_id).first() if payment.user_id else None
+            if payer is None and meta.get("email"):
+                # QR created without a login: link the order to the account with that email
+                payer = get_user_by_email(db, meta["email"])
             order = Order(
-                customer_name=meta.get("customer_name", ""),
-                email=meta.get("email", ""),
+                user_id=payer.id if payer else None,
+                customer_name=meta.get("customer_name") or (payer.name if payer else ""),
+                email=meta.get("email") or (payer.email if payer else ""),
                 phone=meta.get("phone", ""),
                 address=meta.get("address", ""),
                 total_amount=(payment.amount / 100.0),
                 items=json.dumps(order_items),
             )
             db.add(order)
-            db.commit()
+            db.flush()
+            add_order_items(db, order.id, parse_order_items(order_items))
+            product_ids, short = commit_payment_reservations(db, payment.id, order.id)
             payment.order_id = order.id
             db.add(payment)
             db.commit()
+            refresh_product_documents(db, product_ids)
+            notify_short_stock(db, order.id, short)
 
     return {"ok": True}
 
 
-# Initialize sample data
+# Startup seed data
+# Declarative rows upserted by natural key (name, category). The seed runs once per
+# schema version (tracked in `seed_runs`) and can be turned off with SEED_DATA=0.
+SEED_DATA = os.getenv("SEED_DATA", "1").lower() in ("1", "true", "yes")
+SEED_SERVICES = [
+    {
+        "name": "PAN Card Application",
+        "category": "online",
+        "description": "Complete PAN card application and processing service",
+        "price": 500.0,
+        "required_documents": "Aadhar card, Photo, Address proof",
+    },
+    {
+        "name": "Passport Services",
+        "category": "online",
+        "description": "Passport application, renewal, and correction services",
+        "price": 1500.0,
+        "required_documents": "Aadhar, Birth certificate, Photos",
+    },
+    {
+        "name": "Wedding Catering",
+        "category": "catering",
+        "description": "Premium wedding catering with customizable menu",
+        "price": None,
+        "required_documents": None,
+    },
+    {
+        "name": "Bridal Makeup",
+        "category": "beautician",
+        "description": "Professional bridal makeup with hair styling",
+        "price": 5000.0,
+        "required_documents": None,
+    },
+    {
+        "name": "Home Puja Service",
+        "category": "pooja",
+        "description": "Complete home puja service with experienced pandit",
+        "price": 2000.0,
+        "required_documents": None,
+    },
+]
+
+
+def seed_services(db: Session) -> int:
+    """Upsert SEED_SERVICES by (name, category); returns the rows inserted or changed."""
+    existing = {}
+    for service in (
+        db.query(Service)
+        .filter(Service.name.in_([row["name"] for row in SEED_SERVICES]))
+        .order_by(Service.id)
+    ):
+        existing.setdefault((service.name, service.category), service)
+    changed = 0
+    for row in SEED_SERVICES:
+        service = existing.get((row["name"], row["category"]))
+        if service is None:
+            db.add(Service(**row))
+            changed += 1
+            continue
+        updates = {key: value for key, value in row.items() if getattr(service, key) != value}
+        for key, value in updates.items():
+            setattr(service, key, value)
+        changed += bool(updates)
+    return changed
+
+
+def dedupe_services(db: Session) -> int:
+    """Delete duplicate services, keeping the oldest row per (name, category).
+    Returns the number of rows removed (caller commits).
+    """
+    keep = (
+        db.query(func.min(Service.id))
+        .group_by(Service.name, Service.category)
+        .scalar_subquery()
+    )
+    return db.query(Service).filter(Service.id.notin_(keep)).delete(synchronize_session=False)
+
+
 @app.on_event("startup")
 def init_data():
+    if not SEED_DATA:
+        return
     db = SessionLocal()
     try:
-        
-        # Sample Services
-        services = [
-            Service(name="PAN Card Application", category="online", 
-                   description="Complete PAN card application and processing service",
-                   price=500.0, required_documents="Aadhar card, Photo, Address proof"),
-            Service(name="Passport Services", category="online",
-                   description="Passport application, renewal, and correction services",
-                   price=1500.0, required_documents="Aadhar, Birth certificate, Photos"),
-            Service(name="Wedding Catering", category="catering",
-                   description="Premium wedding catering with customizable menu",
-                   price=None, required_documents=None),
-            Service(name="Bridal Makeup", category="beautician",
-                   description="Professional bridal makeup with hair styling",
-                   price=5000.0, required_documents=None),
-            Service(name="Home Puja Service", category="pooja",
-                   description="Complete home puja service with experienced pandit",
-                   price=2000.0, required_documents=None),
-        ]
-        for service in services:
-            db.add(service)
-        db.commit()
-
+        run = db.get(SeedRun, "services")
+        if run is not None and run.schema_version == SCHEMA_VERSION:
+            return
+        changed = seed_services(db)
+        if run is None:
+            db.add(SeedRun(name="services", schema_version=SCHEMA_VERSION, applied_at=datetime.utcnow()))
+        else:
+            run.schema_version = SCHEMA_VERSION
+            run.applied_at = datetime.utcnow()
+        try:
+            db.commit()
+        except IntegrityError:
+            # another worker seeded concurrently
+            db.rollback()
+            return
+        if changed:
+            invalidate_services()
     finally:
         db.close()
 
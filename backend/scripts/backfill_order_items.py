@@ -0,0 +1,44 @@
+"""Copy the items of existing orders into the `order_items` table.
+
+Orders placed since the table was added write their lines at checkout; run this
+once after migrating to parse the `Order.items` JSON of older orders. Each chunk
+is committed on its own and orders that already have lines are skipped, so the
+script can be stopped and run again:
+  cd backend
+  python scripts/backfill_order_items.py --chunk-size 500
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import ORDER_ITEMS_BACKFILL_CHUNK, SessionLocal, backfill_order_items_chunk, verify_schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill order_items from Order.items JSON.")
+    parser.add_argument("--chunk-size", type=int, default=ORDER_ITEMS_BACKFILL_CHUNK)
+    args = parser.parse_args()
+
+    verify_schema()
+    db = SessionLocal()
+    after_id, chunks, lines = 0, 0, 0
+    try:
+        while True:
+            last_id, written = backfill_order_items_chunk(db, after_id, args.chunk_size)
+            if last_id is None:
+                break
+            db.commit()
+            chunks += 1
+            lines += written
+            after_id = last_id
+            print(f"  up to order {last_id}: {lines} lines")
+    finally:
+        db.close()
+    print(f"Backfilled {lines} order lines in {chunks} chunks.")
+
+
+if __name__ == '__main__':
+    main()
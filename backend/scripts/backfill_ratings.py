@@ -0,0 +1,37 @@
+"""Recompute the product rating aggregates from the `reviews` table.
+
+The aggregates are maintained by the review endpoint; run this after importing
+or deleting reviews with SQL so listings show the right ratings again:
+  cd backend
+  python scripts/backfill_ratings.py
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import (
+    SessionLocal,
+    backfill_rating_aggregates,
+    invalidate_products,
+    rebuild_all_product_documents,
+    verify_schema,
+)
+
+
+def main():
+    verify_schema()
+    db = SessionLocal()
+    try:
+        backfill_rating_aggregates(db)
+        db.commit()
+        total = rebuild_all_product_documents(db)
+    finally:
+        db.close()
+    invalidate_products()
+    print(f"Recomputed rating aggregates for {total} products.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Benchmark the large list endpoints with and without the fast JSON path and
+response compression.
+
+Seeds a throwaway SQLite database with N clothing products (3 colors x 4 sizes
+each, default 10,000 products) and reports p50/p99 latency and bytes on the wire
+for `GET /api/products` per configuration. FastAPI's TestClient needs httpx:
+  cd backend
+  pip install httpx
+  python scripts/bench_catalog.py --products 10000 --requests 20
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+COLORS = [("Red", "#e53935"), ("Blue", "#1e88e5"), ("Green", "#43a047")]
+SIZES = ["S", "M", "L", "XL"]
+
+
+def seed(app_main, count: int):
+    """Bulk-insert the benchmark catalog with executemany batches."""
+    from sqlalchemy import insert
+
+    db = app_main.SessionLocal()
+    try:
+        db.execute(
+            insert(app_main.Product),
+            [
+                {
+                    "id": i,
+                    "name": f"Cotton Kurta {i}",
+                    "category": "clothing",
+                    "subcategory": ("kurta", "saree", "tees")[i % 3],
+                    "description": "Handloom cotton kurta with block print detailing. " * 3,
+                    "price": 299.0 + (i % 50) * 40,
+                    "age_group": ("kids", "adult")[i % 2],
+                }
+                for i in range(1, count + 1)
+            ],
+        )
+        variants, images, sizes = [], [], []
+        vid = 0
+        for pid in range(1, count + 1):
+            for color, hexc in COLORS:
+                vid += 1
+                variants.append({"id": vid, "product_id": pid, "color": color, "color_code": hexc})
+                images.append({"variant_id": vid, "image_url": f"https://res.cloudinary.com/demo/image/upload/p{pid}_{color}.jpg"})
+                sizes.extend({"variant_id": vid, "size": s, "stock": (pid + vid) % 7} for s in SIZES)
+        db.execute(insert(app_main.Variant), variants)
+        db.execute(insert(app_main.VariantImage), images)
+        db.execute(insert(app_main.VariantSize), sizes)
+        db.commit()
+    finally:
+        db.close()
+
+
+def percentile(samples: list, p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+
+def run(client, url: str, encoding: str, requests: int):
+    timings, wire = [], 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        resp = client.get(url, headers={"Accept-Encoding": encoding})
+        timings.append((time.perf_counter() - start) * 1000)
+        resp.raise_for_status()
+        # content-length is the encoded size; httpx has already decompressed .content
+        wire = int(resp.headers.get("content-length") or len(resp.content))
+    return percentile(timings, 0.5), percentile(timings, 0.99), wire
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    import main as app_main
+    from fastapi.testclient import TestClient
+
+    app_main.migrate()
+    print(f"Seeding {args.products} products into {tmp} ...")
+    seed(app_main, args.products)
+    # measure serialization and transfer, not cache hits
+    app_main.catalog_cache.maxsize = 0
+    client = TestClient(app_main.app)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    scenarios = [("stdlib json, identity", False, "identity")]
+    if app_main.orjson is not None:
+        scenarios.append(("orjson, identity", True, "identity"))
+        scenarios.append(("orjson, gzip", True, "gzip"))
+        if app_main.BrotliMiddleware is not None:
+            scenarios.append(("orjson, br", True, "br"))
+    else:
+        scenarios.append(("stdlib json, gzip", False, "gzip"))
+
+    for url in ("/api/products", "/api/products?limit=50"):
+        print(f"\nGET {url} ({args.requests} requests per scenario)")
+        print(f"  {'scenario':<24}{'p50 ms':>10}{'p99 ms':>10}{'bytes':>14}")
+        for label, fast, encoding in scenarios:
+            app_main.FAST_JSON = fast
+            p50, p99, wire = run(client, url, encoding, args.requests)
+            print(f"  {label:<24}{p50:>10.1f}{p99:>10.1f}{wire:>14,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Benchmark `PUT /api/products/{id}` variant synchronization on large variant matrices.
+
+Seeds a throwaway SQLite database with one product per matrix size (colors x
+sizes, 3 images per color) and times typical admin edits, reporting latency and
+the number of SQL statements each edit issues:
+  cd backend
+  pip install httpx
+  python scripts/bench_variant_sync.py --colors 10 --sizes 8 --requests 20
+"""
+import argparse
+import copy
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SIZE_NAMES = ["XS", "S", "M", "L", "XL", "XXL", "3XL", "4XL", "5XL", "6XL", "7XL", "8XL"]
+
+
+def seed(app_main, colors: int, sizes: int) -> int:
+    db = app_main.SessionLocal()
+    try:
+        product = app_main.Product(
+            name="Bench Kurta", category="clothing", subcategory="kurta", description="bench", price=999.0
+        )
+        db.add(product)
+        db.flush()
+        for c in range(colors):
+            variant = app_main.Variant(product_id=product.id, color=f"Color {c}", color_code=f"#{c:06x}")
+            db.add(variant)
+            db.flush()
+            db.add_all(
+                [app_main.VariantImage(variant_id=variant.id, image_url=f"https://img/{c}/{i}.jpg") for i in range(3)]
+            )
+            db.add_all(
+                [app_main.VariantSize(variant_id=variant.id, size=SIZE_NAMES[s % len(SIZE_NAMES)] + ("" if s < len(SIZE_NAMES) else str(s)), stock=10) for s in range(sizes)]
+            )
+        db.commit()
+        return product.id
+    finally:
+        db.close()
+
+
+def current_payload(client, product_id: int) -> dict:
+    doc = client.get(f"/api/products/{product_id}").json()
+    return {
+        "variants": [
+            {
+                "id": v["id"],
+                "color": v["color"],
+                "color_code": v["color_code"],
+                "images": v["images"],
+                "sizes": v["sizes"],
+            }
+            for v in doc["variants"]
+        ]
+    }
+
+
+def edits(base: dict):
+    """(label, payload factory) pairs; factories get the iteration number."""
+
+    def unchanged(i):
+        return copy.deepcopy(base)
+
+    def restock_all(i):
+        payload = copy.deepcopy(base)
+        for v in payload["variants"]:
+            for s in v["sizes"]:
+                s["stock"] = 10 + (i % 2)
+        return payload
+
+    def rename_one_color(i):
+        payload = copy.deepcopy(base)
+        payload["variants"][0]["color"] = f"Renamed {i % 2}"
+        return payload
+
+    def replace_one_image(i):
+        payload = copy.deepcopy(base)
+        payload["variants"][-1]["images"][1] = f"https://img/new/{i % 2}.jpg"
+        return payload
+
+    return [
+        ("no change", unchanged),
+        ("restock every size", restock_all),
+        ("rename one color", rename_one_color),
+        ("replace one image", replace_one_image),
+    ]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--colors", type=int, default=10)
+    parser.add_argument("--sizes", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    import main as app_main
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    app_main.migrate()
+    product_id = seed(app_main, args.colors, args.sizes)
+    client = TestClient(app_main.app)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    statements = {"n": 0}
+
+    @event.listens_for(app_main.engine, "before_cursor_execute")
+    def count(*_):
+        statements["n"] += 1
+
+    base = current_payload(client, product_id)
+    print(f"PUT /api/products/{product_id}: {args.colors} colors x {args.sizes} sizes, 3 images per color")
+    print(f"  {'edit':<22}{'p50 ms':>10}{'p99 ms':>10}{'statements':>12}")
+    for label, make in edits(base):
+        timings, counts = [], []
+        for i in range(args.requests):
+            payload = make(i)
+            statements["n"] = 0
+            start = time.perf_counter()
+            resp = client.put(f"/api/products/{product_id}", json=payload)
+            timings.append((time.perf_counter() - start) * 1000)
+            counts.append(statements["n"])
+            resp.raise_for_status()
+        print(f"  {label:<22}{percentile(timings, 0.5):>10.1f}{percentile(timings, 0.99):>10.1f}{max(counts):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""Remove duplicate rows from the `services` table.
+
+Older builds inserted the sample services on every startup. This keeps the
+oldest row for each (name, category) and deletes the rest; bookings and
+inquiries reference services by name, so nothing else needs rewriting:
+  cd backend
+  python scripts/dedupe_services.py
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import SessionLocal, dedupe_services, invalidate_services, verify_schema
+
+
+def main():
+    verify_schema()
+    db = SessionLocal()
+    try:
+        removed = dedupe_services(db)
+        db.commit()
+    finally:
+        db.close()
+    if removed:
+        invalidate_services()
+    print(f"Removed {removed} duplicate services.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""Rebuild the materialized `product_documents` rows for every product.
+
+Run this after schema migrations, manual SQL edits or restores so that
+`GET /api/products/{id}` serves documents matching the product tables:
+  cd backend
+  python scripts/rebuild_product_documents.py
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import SessionLocal, rebuild_all_product_documents, invalidate_products, verify_schema
+
+
+def main():
+    verify_schema()
+    db = SessionLocal()
+    try:
+        total = rebuild_all_product_documents(db)
+    finally:
+        db.close()
+    # running workers key their caches by catalog version, so bumping it is enough
+    invalidate_products()
+    print(f"Rebuilt {total} product documents.")
+
+
+if __name__ == '__main__':
+    main()
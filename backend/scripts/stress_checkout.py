@@ -0,0 +1,142 @@
+"""Stress-test stock reservation with many concurrent checkouts of the same size.
+
+Creates a product with one size holding --stock units, then fires --checkouts
+concurrent orders (a mix of direct orders, UPI QRs for the cart, which hold stock,
+and orders paid with a QR for a bare amount, which take stock when placed) from
+--workers threads. Fails unless exactly --stock units were sold, no checkout got
+stock that was not there, and the final stock is exactly zero. Uses a throwaway
+SQLite database unless --database-url is given (e.g. a Postgres test database):
+  cd backend
+  pip install httpx
+  python scripts/stress_checkout.py --stock 50 --checkouts 400 --workers 32
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def seed(app_main, stock: int) -> tuple:
+    db = app_main.SessionLocal()
+    try:
+        email = f"stress-{time.time_ns()}@example.com"
+        user = app_main.User(
+            name="Stress", email=email, phone="0", hashed_password=app_main.get_password_hash("stress-test")
+        )
+        product = app_main.Product(
+            name="Stress Tee", category="clothing", subcategory="tees", description="stress", price=100.0
+        )
+        db.add_all([user, product])
+        db.flush()
+        variant = app_main.Variant(product_id=product.id, color="Black", color_code="#000000")
+        db.add(variant)
+        db.flush()
+        size = app_main.VariantSize(variant_id=variant.id, size="M", stock=stock)
+        db.add(size)
+        db.commit()
+        return email, product.id, variant.id, size.id
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stock", type=int, default=50)
+    parser.add_argument("--checkouts", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        tmp = tempfile.mkdtemp()
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'stress.db')}"
+    os.environ["ALLOW_LOCAL_RAZORPAY_QR"] = "1"
+    os.environ.pop("RAZORPAY_KEY_ID", None)
+    os.environ["SEED_DATA"] = "0"
+    import main as app_main
+    from fastapi.testclient import TestClient
+
+    app_main.migrate()
+    email, product_id, variant_id, size_id = seed(app_main, args.stock)
+    headers = {"Authorization": "Bearer " + app_main.create_access_token({"sub": email})}
+    item = {"id": product_id, "variant_id": variant_id, "size": "M", "quantity": 1}
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("vruksha.notifications").setLevel(logging.ERROR)
+
+    def pay_bare_qr(client) -> int:
+        resp = client.post("/api/payments/create_razorpay_qr", json={"amount": 200}, headers=headers)
+        resp.raise_for_status()
+        payment_id = resp.json()["payment_id"]
+        # stand-in for the capture webhook, which would place an order without items
+        db = app_main.SessionLocal()
+        try:
+            db.get(app_main.Payment, payment_id).status = "paid"
+            db.commit()
+        finally:
+            db.close()
+        return payment_id
+
+    def checkout(client, i: int) -> str:
+        if i % 3 == 1:
+            resp = client.post(
+                "/api/payments/create_razorpay_qr", json={"amount": 100, "metadata": {"items": [item]}}, headers=headers
+            )
+        else:
+            order = {
+                "customer_name": "Stress",
+                "email": email,
+                "phone": "0",
+                "address": "-",
+                "total_amount": 100,
+                "items": json.dumps([item]),
+            }
+            if i % 3 == 2:
+                order["payment_id"] = pay_bare_qr(client)
+            resp = client.post("/api/orders", json=order, headers=headers)
+        if resp.status_code == 200:
+            return "sold"
+        if resp.status_code == 409:
+            return "out of stock"
+        return f"HTTP {resp.status_code}"
+
+    with TestClient(app_main.app) as client:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            outcomes = Counter(pool.map(lambda i: checkout(client, i), range(args.checkouts)))
+        elapsed = time.perf_counter() - start
+
+    db = app_main.SessionLocal()
+    try:
+        final_stock = db.get(app_main.VariantSize, size_id).stock
+        reserved = sum(
+            r.quantity
+            for r in db.query(app_main.StockReservation).filter(
+                app_main.StockReservation.variant_size_id == size_id,
+                app_main.StockReservation.status.in_(["held", "committed"]),
+            )
+        )
+    finally:
+        db.close()
+
+    print(f"{args.checkouts} checkouts of {args.stock} units, {args.workers} workers, {elapsed:.2f} s")
+    for outcome, count in sorted(outcomes.items()):
+        print(f"  {outcome:<14}{count:>6}")
+    print(f"  final stock   {final_stock:>6}")
+    print(f"  reserved      {reserved:>6}")
+    ok = outcomes["sold"] == args.stock == reserved and final_stock == 0 and len(outcomes) <= 2
+    print("OK" if ok else "FAILED: stock was oversold, lost or a checkout errored")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
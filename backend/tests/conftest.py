@@ -0,0 +1,26 @@
+"""Run the app against a throwaway SQLite database. The environment is set before
+`main` is first imported, since it reads its configuration at import time.
+"""
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["AUTO_MIGRATE"] = "1"
+os.environ["SEED_DATA"] = "0"
+os.environ["CATALOG_CACHE_SIZE"] = "0"
+os.environ["ALLOW_LOCAL_RAZORPAY_QR"] = "1"
+os.environ.pop("RAZORPAY_KEY_ID", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as client:
+        yield client
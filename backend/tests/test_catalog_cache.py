@@ -0,0 +1,72 @@
+"""Conditional GETs of catalog responses: ETags change when the data does."""
+import json
+
+import main
+
+
+def seed_product(category: str, stock: int = 5) -> tuple:
+    db = main.SessionLocal()
+    try:
+        product = main.Product(name="Tee", category=category, subcategory="tees", description="cotton", price=100.0)
+        db.add(product)
+        db.flush()
+        variant = main.Variant(product_id=product.id, color="Black", color_code="#000000")
+        db.add(variant)
+        db.flush()
+        size = main.VariantSize(variant_id=variant.id, size="M", stock=stock)
+        db.add(size)
+        main.reindex_products(db, [product.id])
+        db.commit()
+        return product.id, variant.id, size.id
+    finally:
+        db.close()
+
+
+def test_deleted_product_does_not_revalidate(client):
+    product_id, _, _ = seed_product("etag-delete")
+    first = client.get(f"/api/products/{product_id}")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert client.get(f"/api/products/{product_id}", headers={"If-None-Match": etag}).status_code == 304
+
+    # removed outside the API, so the catalog version does not change
+    db = main.SessionLocal()
+    try:
+        db.query(main.ProductDocument).filter(main.ProductDocument.product_id == product_id).delete()
+        db.query(main.VariantSize).filter(main.VariantSize.variant_id.in_(
+            db.query(main.Variant.id).filter(main.Variant.product_id == product_id)
+        )).delete(synchronize_session=False)
+        db.query(main.Variant).filter(main.Variant.product_id == product_id).delete()
+        db.query(main.Product).filter(main.Product.id == product_id).delete()
+        db.commit()
+    finally:
+        db.close()
+    assert client.get(f"/api/products/{product_id}", headers={"If-None-Match": etag}).status_code == 404
+
+
+def test_checkout_refreshes_only_the_ordered_product(client, monkeypatch):
+    monkeypatch.setattr(main, "CATALOG_STOCK_LAG", 10**9)
+    product_id, variant_id, _ = seed_product("etag-stock", stock=5)
+    db = main.SessionLocal()
+    try:
+        email = f"etag-{product_id}@example.com"
+        db.add(main.User(name="Buyer", email=email, phone="0", hashed_password=main.get_password_hash("etag")))
+        db.commit()
+    finally:
+        db.close()
+    headers = {"Authorization": "Bearer " + main.create_access_token({"sub": email})}
+
+    listing = client.get("/api/products?category=etag-stock")
+    detail = client.get(f"/api/products/{product_id}")
+    item = {"id": product_id, "variant_id": variant_id, "size": "M", "quantity": 2}
+    order = {"customer_name": "Buyer", "email": email, "phone": "0", "address": "-", "items": json.dumps([item])}
+    assert client.post("/api/orders", json=order, headers=headers).status_code == 200
+
+    # listings keep their version (and cache) until the stock window rolls over
+    assert client.get(
+        "/api/products?category=etag-stock", headers={"If-None-Match": listing.headers["ETag"]}
+    ).status_code == 304
+    # the ordered product's detail shows the new stock
+    fresh = client.get(f"/api/products/{product_id}", headers={"If-None-Match": detail.headers["ETag"]})
+    assert fresh.status_code == 200
+    assert fresh.json()["variants"][0]["sizes"][0]["stock"] == 3
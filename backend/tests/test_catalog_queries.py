@@ -0,0 +1,55 @@
+"""GET /api/products must issue the same number of SQL statements whatever the
+size of the catalog (variants, images and sizes are loaded in batches).
+"""
+from sqlalchemy import event
+
+import main
+
+
+def seed(count: int, category: str):
+    db = main.SessionLocal()
+    try:
+        ids = []
+        for i in range(count):
+            product = main.Product(
+                name=f"{category} {i}", category=category, subcategory="tees", description="cotton", price=100 + i
+            )
+            db.add(product)
+            db.flush()
+            for c in range(3):
+                variant = main.Variant(product_id=product.id, color=f"Color {c}", color_code="#000000")
+                db.add(variant)
+                db.flush()
+                db.add_all([main.VariantImage(variant_id=variant.id, image_url=f"https://img/{i}/{c}/{n}.jpg") for n in range(2)])
+                db.add_all([main.VariantSize(variant_id=variant.id, size=s, stock=5) for s in ("S", "M", "L")])
+            ids.append(product.id)
+        main.reindex_products(db, ids)
+        db.commit()
+    finally:
+        db.close()
+
+
+def count_queries(client, url: str) -> tuple:
+    statements = []
+
+    def record(*_):
+        statements.append(1)
+
+    event.listen(main.engine, "before_cursor_execute", record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(main.engine, "before_cursor_execute", record)
+    assert response.status_code == 200
+    return len(statements), response.json()
+
+
+def test_product_listing_query_count_is_independent_of_catalog_size(client):
+    seed(1, "single")
+    seed(40, "many")
+    one, products = count_queries(client, "/api/products?category=single")
+    assert len(products) == 1
+    many, products = count_queries(client, "/api/products?category=many")
+    assert len(products) == 40
+    assert all(len(p["variants"]) == 3 for p in products)
+    assert one == many
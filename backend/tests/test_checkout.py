@@ -0,0 +1,97 @@
+"""Orders placed with a paid UPI QR take stock exactly once and keep the price
+fixed when the QR was created.
+"""
+import json
+import time
+
+import main
+
+
+def seed(stock: int) -> tuple:
+    db = main.SessionLocal()
+    try:
+        email = f"checkout-{time.time_ns()}@example.com"
+        user = main.User(name="Buyer", email=email, phone="0", hashed_password=main.get_password_hash("checkout"))
+        product = main.Product(name="Tee", category="checkout", subcategory="tees", description="cotton", price=100.0)
+        db.add_all([user, product])
+        db.flush()
+        variant = main.Variant(product_id=product.id, color="Black", color_code="#000000")
+        db.add(variant)
+        db.flush()
+        size = main.VariantSize(variant_id=variant.id, size="M", stock=stock)
+        db.add(size)
+        db.commit()
+        headers = {"Authorization": "Bearer " + main.create_access_token({"sub": email})}
+        item = {"id": product.id, "variant_id": variant.id, "size": "M", "quantity": 2}
+        return headers, item, product.id, size.id
+    finally:
+        db.close()
+
+
+def create_paid_qr(client, headers: dict, payload: dict) -> int:
+    response = client.post("/api/payments/create_razorpay_qr", json=payload, headers=headers)
+    assert response.status_code == 200
+    payment_id = response.json()["payment_id"]
+    db = main.SessionLocal()
+    try:
+        db.get(main.Payment, payment_id).status = "paid"
+        db.commit()
+    finally:
+        db.close()
+    return payment_id
+
+
+def place_order(client, headers: dict, item: dict, payment_id: int):
+    order = {
+        "customer_name": "Buyer",
+        "email": "ignored@example.com",
+        "phone": "0",
+        "address": "-",
+        "items": json.dumps([item]),
+        "payment_id": payment_id,
+    }
+    return client.post("/api/orders", json=order, headers=headers)
+
+
+def stock_of(size_id: int) -> int:
+    db = main.SessionLocal()
+    try:
+        return db.get(main.VariantSize, size_id).stock
+    finally:
+        db.close()
+
+
+def test_bare_amount_qr_orders_take_stock(client):
+    headers, item, _, size_id = seed(stock=2)
+    first = create_paid_qr(client, headers, {"amount": 300})
+    second = create_paid_qr(client, headers, {"amount": 300})
+    assert stock_of(size_id) == 2
+
+    assert place_order(client, headers, item, first).status_code == 200
+    assert stock_of(size_id) == 0
+    response = place_order(client, headers, item, second)
+    assert response.status_code == 409
+    assert response.json()["detail"]["error"] == "out_of_stock"
+    assert stock_of(size_id) == 0
+
+
+def test_qr_order_keeps_price_fixed_at_qr_creation(client):
+    headers, item, product_id, size_id = seed(stock=2)
+    payment_id = create_paid_qr(client, headers, {"amount": 1, "metadata": {"items": [item]}})
+    assert stock_of(size_id) == 0
+    db = main.SessionLocal()
+    try:
+        db.get(main.Product, product_id).price = 900.0
+        db.commit()
+    finally:
+        db.close()
+
+    response = place_order(client, headers, item, payment_id)
+    assert response.status_code == 200
+    db = main.SessionLocal()
+    try:
+        order = db.get(main.Order, response.json()["id"])
+        assert order.total_amount == 300.0
+    finally:
+        db.close()
+    assert stock_of(size_id) == 0
@@ -0,0 +1,160 @@
+"""The hot endpoints must be served by indexes: every statement they run is
+captured as issued and checked with EXPLAIN QUERY PLAN for full table scans.
+"""
+import json
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+import main
+
+EMAIL = "indexes@example.com"
+TABLES = set(main.Base.metadata.tables)
+# "SCAN orders" without "USING ..." reads the whole table; SQLite names aliased
+# tables like product_variants_1
+FULL_SCAN = re.compile(r"^SCAN (\w+?)(?:_\d+)?(?: |$)(?!.*\bUSING\b)")
+
+
+@pytest.fixture(scope="module")
+def data(client):
+    db = main.SessionLocal()
+    try:
+        admin = main.User(
+            name="Admin", email=EMAIL, phone="0", hashed_password=main.get_password_hash("indexes"), is_admin=True
+        )
+        product = main.Product(name="Tee", category="indexes", subcategory="tees", description="cotton", price=100.0)
+        db.add_all([admin, product])
+        db.flush()
+        variant = main.Variant(product_id=product.id, color="Black", color_code="#000000")
+        db.add(variant)
+        db.flush()
+        db.add(main.VariantImage(variant_id=variant.id, image_url="https://img/tee.jpg"))
+        db.add(main.VariantSize(variant_id=variant.id, size="M", stock=50))
+        db.add(main.Review(product_id=product.id, user_name="Admin", rating=4, text="soft"))
+        db.add(main.Payment(amount=30000, provider="razorpay", status="pending", provider_order_id="qr_indexes"))
+        db.add(
+            main.PasswordResetOTP(
+                email=EMAIL, otp="123456", used=False, expires_at=datetime.utcnow() + timedelta(minutes=10)
+            )
+        )
+        db.commit()
+        item = {"id": product.id, "variant_id": variant.id, "size": "M", "quantity": 1}
+        return {
+            "headers": {"Authorization": "Bearer " + main.create_access_token({"sub": EMAIL})},
+            "product_id": product.id,
+            "item": item,
+        }
+    finally:
+        db.close()
+
+
+def run(client, data, method: str, url: str, **kwargs) -> list:
+    """Send the request and return the SELECT / UPDATE / DELETE statements it ran."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "WITH", "UPDATE", "DELETE"):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    event.listen(main.engine, "before_cursor_execute", record)
+    try:
+        response = client.request(method, url, headers=data["headers"], **kwargs)
+    finally:
+        event.remove(main.engine, "before_cursor_execute", record)
+    assert response.status_code == 200, response.text
+    return statements
+
+
+def order_payload(data) -> dict:
+    return {"customer_name": "Admin", "email": EMAIL, "phone": "0", "address": "-", "items": json.dumps([data["item"]])}
+
+
+# (description, request as (method, url, kwargs) built from the seeded data,
+#  tables the endpoint must read)
+ENDPOINTS = [
+    (
+        "product listing by category",
+        lambda d: ("GET", "/api/products?category=indexes&subcategory=tees", {}),
+        {"products", "product_variants", "variant_images", "variant_sizes"},
+    ),
+    (
+        "product listing by size and stock",
+        lambda d: ("GET", "/api/products?category=indexes&size=m&in_stock=true", {}),
+        {"products", "variant_sizes"},
+    ),
+    (
+        "first page of a product's reviews",
+        lambda d: ("GET", f"/api/products/{d['product_id']}/reviews", {}),
+        {"reviews"},
+    ),
+    (
+        "checkout",
+        lambda d: ("POST", "/api/orders", {"json": order_payload(d)}),
+        {"stock_reservations", "variant_sizes", "carts"},
+    ),
+    (
+        "UPI QR for a cart",
+        lambda d: ("POST", "/api/payments/create_razorpay_qr", {"json": {"metadata": {"items": [d["item"]]}}}),
+        {"stock_reservations", "variant_sizes"},
+    ),
+    (
+        "payment webhook",
+        lambda d: (
+            "POST",
+            "/api/payments/razorpay/webhook",
+            {"json": {"event": "payment.captured", "payload": {"payment": {"entity": {"id": "pay_indexes", "qr_id": "qr_indexes"}}}}},
+        ),
+        {"payments", "stock_reservations"},
+    ),
+    (
+        "orders of a user",
+        lambda d: ("GET", "/api/orders/user", {}),
+        {"orders", "shipments"},
+    ),
+    (
+        "admin orders by email",
+        lambda d: ("GET", f"/api/admin/orders?email={EMAIL}", {}),
+        {"orders", "shipments"},
+    ),
+    (
+        "admin order listing page",
+        lambda d: ("GET", "/api/admin/orders", {}),
+        {"orders", "shipments"},
+    ),
+    (
+        "cart of a user",
+        lambda d: ("GET", "/api/cart", {}),
+        {"carts"},
+    ),
+    (
+        "unacknowledged admin notifications",
+        lambda d: ("GET", "/api/admin/notifications?acknowledged=false", {}),
+        {"admin_notifications"},
+    ),
+    (
+        "password reset OTP verification",
+        lambda d: ("POST", "/api/auth/verify-otp", {"json": {"email": EMAIL, "otp": "123456"}}),
+        {"password_reset_otps"},
+    ),
+]
+
+
+@pytest.mark.parametrize("description, request_for, tables", ENDPOINTS, ids=[e[0] for e in ENDPOINTS])
+def test_endpoint_queries_use_indexes(client, data, description, request_for, tables):
+    method, url, kwargs = request_for(data)
+    statements = run(client, data, method, url, **kwargs)
+
+    read = set()
+    scans = []
+    with main.engine.connect() as conn:
+        for statement, parameters in statements:
+            plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+            read.update(t for t in TABLES if re.search(rf"\b{t}\b", statement))
+            for line in plan:
+                match = FULL_SCAN.match(line)
+                if match and match.group(1) in TABLES:
+                    scans.append(f"{line}\n    in: {' '.join(statement.split())}")
+    assert tables <= read, f"{description} no longer reads {sorted(tables - read)}"
+    assert not scans, f"{description} scans a whole table:\n" + "\n".join(scans)
@@ -16,6 +16,7 @@ const Admin = () => {
   const [productsList, setProductsList] = useState([])
   const [editingProduct, setEditingProduct] = useState(null)
   const [ordersList, setOrdersList] = useState([])
+  const [ordersCursor, setOrdersCursor] = useState(null)
   const [usersList, setUsersList] = useState([])
   const [shipmentStates, setShipmentStates] = useState({})
   const [expandedOrder, setExpandedOrder] = useState(null)
@@ -250,10 +251,12 @@ const Admin = () => {
     }
   }
 
-  const fetchOrdersList = async () => {
+  // Loads the first page of orders, or appends the next page when `more` is set
+  const fetchOrdersList = async (more = false) => {
     try {
-      const data = await adminApi.listOrders()
-      setOrdersList(data)
+      const { orders: data, next } = await adminApi.listOrders(more === true && ordersCursor ? { after: ordersCursor } : {})
+      setOrdersList(prev => (more === true ? [...prev, ...data] : data))
+      setOrdersCursor(next)
       // initialize per-order shipment inputs from server data if available
       const initial = {}
       data.forEach(o => {
@@ -266,7 +269,7 @@ const Admin = () => {
           initial[o.id] = { courier_name: '', tracking_number: '' }
         }
       })
-      setShipmentStates(initial)
+      setShipmentStates(prev => (more === true ? { ...prev, ...initial } : initial))
     } catch (err) {
       console.error('Failed to fetch orders:', err)
       showMessage('Failed to fetch orders', true)
@@ -1065,7 +1068,7 @@ const Admin = () => {
             <div className="admin-section">
               <h2>Orders Received</h2>
               <div style={{ marginBottom: 16 }}>
-                <button className="btn btn-secondary" onClick={fetchOrdersList}>Refresh Orders</button>
+                <button className="btn btn-secondary" onClick={() => fetchOrdersList()}>Refresh Orders</button>
               </div>
               <div className="orders-grid">
                 {ordersList.map(o => (
@@ -1123,6 +1126,11 @@ const Admin = () => {
                   </div>
                 ))}
               </div>
+              {ordersCursor && (
+                <div style={{ marginTop: 16 }}>
+                  <button className="btn btn-secondary" onClick={() => fetchOrdersList(true)}>Load More Orders</button>
+                </div>
+              )}
             </div>
           )}
           {activeTab === 'users' && (
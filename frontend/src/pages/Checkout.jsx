@@ -192,7 +192,8 @@ const Checkout = () => {
           // store pending payment id for fallback
           sessionStorage.setItem('pending_payment_id', createResp.payment_id)
           // Save the order payload so we can create the order if webhook hasn't run by the time payment is verified
-          sessionStorage.setItem('pending_order', JSON.stringify({ ...orderData }))
+          // payment_id lets the backend attach this QR's stock reservation to the order
+          sessionStorage.setItem('pending_order', JSON.stringify({ ...orderData, payment_id: createResp.payment_id }))
           // show modal UI
           setQrState({
             visible: true,
@@ -215,6 +216,10 @@ const Checkout = () => {
       navigate('/orders')
     } catch (error) {
       console.error('Error placing order:', error)
+      if (error.response && error.response.status === 409) {
+        showToast('Some items in your cart are out of stock or no longer available. Please update your cart.', 'error')
+        return
+      }
     showToast('Could not place order. Please try again.', 'error')
     }
   }
@@ -7,6 +7,7 @@ import { useNavigate } from 'react-router-dom'
 const Orders = () => {
   const { user } = useAuth()
   const [orders, setOrders] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
   const [loading, setLoading] = useState(true)
   const [expanded, setExpanded] = useState(null)
   const navigate = useNavigate()
@@ -16,8 +17,9 @@ const Orders = () => {
       setLoading(true)
       try {
         const token = localStorage.getItem('token')
-        const data = await api.getUserOrders(token)
+        const { orders: data, next } = await api.getUserOrders(token)
         setOrders(data || [])
+        setNextCursor(next)
       } catch (e) {
         console.error('Failed to fetch orders:', e)
         if (e.response && e.response.status === 401) {
@@ -46,6 +48,17 @@ const Orders = () => {
 
   const toggle = (id) => setExpanded(prev => (prev === id ? null : id))
 
+  const loadMore = async () => {
+    try {
+      const token = localStorage.getItem('token')
+      const { orders: data, next } = await api.getUserOrders(token, nextCursor)
+      setOrders(prev => [...prev, ...(data || [])])
+      setNextCursor(next)
+    } catch (e) {
+      console.error('Failed to fetch more orders:', e)
+    }
+  }
+
   const renderItems = (itemsJson) => {
     let items = []
     try {
@@ -148,6 +161,11 @@ const Orders = () => {
                 ))}
               </div>
             )}
+            {!loading && nextCursor && (
+              <div style={{ marginTop: 16, textAlign: 'center' }}>
+                <button className="btn btn-secondary" onClick={loadMore}>Load more orders</button>
+              </div>
+            )}
           </div>
         </div>
       </div>
@@ -247,7 +247,7 @@ const ProductDetail = () => {
                   <div className="stars">
                     {[0,1,2,3,4].map((i) => <Star key={i} size={14} />)}
                   </div>
-                  <span className="rcount">({reviews.length || 0})</span>
+                  <span className="rcount">({product.rating_count ?? reviews.length ?? 0})</span>
                 </div>
                 <div className="pd-price">₹{product.price}</div>
               </div>
@@ -16,22 +16,27 @@ const Wishlist = () => {
       const token = localStorage.getItem('token')
       try {
         const data = await api.getWishlist(token)
-        const resolved = await Promise.all((data || []).map(async (it) => {
-          // If wishlist stores just an id or a primitive, fetch product details
-          const id = (typeof it === 'number' || typeof it === 'string') ? it : (it && (it.id || it.product_id))
-          if (id && (!it || (typeof it !== 'object') || (!it.image_url && !(it.images && it.images.length) && !it.selectedImage))) {
-            try {
-              const p = await api.getProduct(id)
-              // keep original object shape if it was an object, but favor product fields
-              return { ...(typeof it === 'object' ? it : {}), id: p.id, name: p.name, price: p.price, description: p.description, images: p.images || [] }
-            } catch (err) {
-              // failed to fetch product; return original
-              return it
-            }
+        // If wishlist stores just an id or a primitive, fetch product details
+        const idOf = (it) => (typeof it === 'number' || typeof it === 'string') ? it : (it && (it.id || it.product_id))
+        const needsDetails = (it) => idOf(it) && (!it || (typeof it !== 'object') || (!it.image_url && !(it.images && it.images.length) && !it.selectedImage))
+        const ids = [...new Set((data || []).filter(needsDetails).map((it) => Number(idOf(it))))]
+        const byId = {}
+        if (ids.length) {
+          try {
+            // one request for every product instead of one per wishlist entry
+            const { products } = await api.getProductsBatch(ids)
+            products.forEach((p) => { byId[p.id] = p })
+          } catch (err) {
+            // failed to fetch products; keep the original entries
           }
-          return it
-        }))
-        setItems(resolved || [])
+        }
+        const resolved = (data || []).map((it) => {
+          const p = needsDetails(it) && byId[Number(idOf(it))]
+          if (!p) return it
+          // keep original object shape if it was an object, but favor product fields
+          return { ...(typeof it === 'object' ? it : {}), id: p.id, name: p.name, price: p.price, description: p.description, images: p.images || [] }
+        })
+        setItems(resolved)
       } catch (err) {
         console.error('Failed to load wishlist', err)
       }
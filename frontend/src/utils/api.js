@@ -17,6 +17,12 @@ export const api = {
     return response.data
   },
 
+  // Resolve many products in one request; returns { products, missing }
+  getProductsBatch: async (ids) => {
+    const response = await axios.post(`${API_BASE_URL}/products/batch`, { ids })
+    return response.data
+  },
+
   getProductReviews: async (productId) => {
     const response = await axios.get(`${API_BASE_URL}/products/${productId}/reviews`)
     return response.data
@@ -50,11 +56,14 @@ export const api = {
     return response.data
   },
 
-  getUserOrders: async (token) => {
+  // One page of the user's orders, newest first; returns { orders, next } where
+  // `next` is the cursor for the following page (null on the last page)
+  getUserOrders: async (token, after = null) => {
     const response = await axios.get(`${API_BASE_URL}/orders/user`, {
-      headers: { Authorization: `Bearer ${token}` }
+      headers: { Authorization: `Bearer ${token}` },
+      params: after ? { after } : {}
     })
-    return response.data
+    return { orders: response.data, next: response.headers['x-next-cursor'] || null }
   },
 
   // Payments - Razorpay QR
@@ -124,11 +133,13 @@ api.removeFromWishlist = async (productId, token) => {
 
 // Admin/order related APIs
 export const adminApi = {
-  listOrders: async () => {
+  // One page of orders, newest first. params: { after, limit, shipped, email, min_amount, created_from, created_to }
+  // Returns { orders, next } where `next` is the cursor for the following page (null on the last page)
+  listOrders: async (params = {}) => {
     const token = localStorage.getItem('token')
     const headers = token ? { Authorization: `Bearer ${token}` } : {}
-    const response = await axios.get(`${API_BASE_URL}/admin/orders`, { headers })
-    return response.data
+    const response = await axios.get(`${API_BASE_URL}/admin/orders`, { headers, params })
+    return { orders: response.data, next: response.headers['x-next-cursor'] || null }
   },
 
   createShipment: async (payload) => {
@@ -175,6 +186,14 @@ adminApi.createVariant = async (productId, payload) => {
   return response.data
 }
 
+// Sales report: units and revenue per product (or per variant size with group_by: 'variant')
+adminApi.salesReport = async (params = {}) => {
+  const token = localStorage.getItem('token')
+  const headers = token ? { Authorization: `Bearer ${token}` } : {}
+  const response = await axios.get(`${API_BASE_URL}/admin/reports/sales`, { headers, params })
+  return response.data
+}
+
 // Admin notifications
 adminApi.listNotifications = async (acknowledged = null) => {
   const token = localStorage.getItem('token')